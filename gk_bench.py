@@ -0,0 +1,481 @@
+from PIL import Image, ImageDraw
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import PIL
+from threading import Thread, Event
+from gk_engine import (
+    SUPPORTED_EXT, FORMATS, ENCODER_PROFILES, MODE_BYTES, make_job, load_job, open_for_job,
+    apply_adjustments, apply_overlay, OverlayCache, save_image, run_batch
+)
+
+# ================= CONFIG ================= #
+# Benchmark harness for the shared engine that the GUI versions and the
+# batch CLI run on. Stages are timed one image at a time in this process;
+# the batch section times whole runs on the process pool per worker count.
+#
+#   python gk_bench.py -o before.json
+#   python gk_bench.py -o after.json --compare before.json
+
+SIZES = {
+    "small": (640, 480),
+    "medium": (1920, 1080),
+    "large": (4000, 3000)
+}
+
+MODES = ["RGB", "RGBA", "L"]
+
+# Formats that cannot store a mode get the closest one they can
+EXT_MODES = {
+    ".jpg": ("RGB", "L"),
+    ".jpeg": ("RGB", "L"),
+    ".bmp": ("RGB", "L")
+}
+
+STAGES = ["decode", "adjust", "resize", "overlay", "encode"]
+
+# Work that exercises every stage; override with -c / the flags below
+BENCH_JOB = {
+    "width": 1280,
+    "height": 720,
+    "brightness": 1.1,
+    "contrast": 1.1,
+    "saturation": 1.2,
+    "sharpness": 1.3
+}
+
+DEFAULT_CORPUS = os.path.join(tempfile.gettempdir(), "gk_bench_corpus")
+SAMPLE_SECS = 0.002
+MB = 1024 * 1024
+
+# ================= CORPUS ================= #
+
+def synthetic_image(size, mode, seed):
+    """Deterministic test image: gradients with some shapes and grain.
+
+    Pure noise would make every encoder look equally bad and flat colour
+    equally good, so this sits in between, like a photo.
+    """
+    rnd = random.Random(seed)
+    w, h = size
+    bands = [
+        Image.linear_gradient("L").rotate(rnd.randrange(360)).resize(size)
+        for _ in range(3)
+    ]
+    img = Image.merge("RGB", bands)
+
+    draw = ImageDraw.Draw(img)
+    for _ in range(24):
+        x, y = rnd.randrange(w), rnd.randrange(h)
+        r = rnd.randrange(max(2, w // 40), max(3, w // 6))
+        color = tuple(rnd.randrange(256) for _ in range(3))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=color)
+
+    grain = Image.frombytes("L", size, rnd.randbytes(w * h)).convert("RGB")
+    img = Image.blend(img, grain, 0.08)
+
+    if mode == "RGBA":
+        img.putalpha(Image.radial_gradient("L").resize(size))
+    elif mode != "RGB":
+        img = img.convert(mode)
+    return img
+
+def corpus_spec(sizes, modes, exts):
+    """(name, size, mode, ext) for every combination a format can hold"""
+    spec = []
+    for size_name in sizes:
+        for mode in modes:
+            for ext in exts:
+                if mode not in EXT_MODES.get(ext, MODES):
+                    continue
+                # Stem includes the extension so outputs never collide
+                spec.append((f"{size_name}_{mode}_{ext[1:]}{ext}", SIZES[size_name], mode, ext))
+    return spec
+
+def make_corpus(folder, spec, seed=0):
+    """Write the corpus into folder, reusing files already generated"""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i, (name, size, mode, ext) in enumerate(spec):
+        path = os.path.join(folder, name)
+        if not os.path.exists(path):
+            img = synthetic_image(size, mode, seed + i)
+            fmt = Image.registered_extensions()[ext]
+            tmp = f"{path}.tmp"
+            img.save(tmp, fmt)
+            os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+def make_logo(size=(400, 200)):
+    """RGBA logo for the overlay stage"""
+    logo = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(logo)
+    draw.rounded_rectangle((0, 0, size[0] - 1, size[1] - 1), radius=40, fill=(255, 255, 255, 160))
+    draw.text((size[0] // 4, size[1] // 3), "gk", fill=(20, 20, 20, 255))
+    return logo
+
+# ================= MEMORY ================= #
+
+def _statm_rss(pid="self"):
+    with open(f"/proc/{pid}/statm", "r") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def _descendant_pids():
+    """Every process below this one. Pool workers are started by the
+    forkserver, so they are grandchildren, not children."""
+    children = {}   # ppid -> [pid]
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat", "r") as f:
+                # ppid is the 2nd field after the parenthesised command name
+                ppid = f.read().rsplit(")", 1)[1].split()[1]
+        except (OSError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(pid)
+
+    pids = []
+    todo = [str(os.getpid())]
+    while todo:
+        for pid in children.get(todo.pop(), []):
+            pids.append(pid)
+            todo.append(pid)
+    return pids
+
+def current_rss(children=False):
+    """Resident bytes of this process (plus every process below it), None if unknown.
+
+    Reads /proc, so it is Linux only; elsewhere peak RSS is not reported.
+    """
+    try:
+        total = _statm_rss()
+        if children:
+            for pid in _descendant_pids():
+                try:
+                    total += _statm_rss(pid)
+                except OSError:
+                    pass
+        return total
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class PeakRSS:
+    """Samples RSS on a background thread while the with block runs.
+
+    start is the RSS on entry and peak the highest seen up to the exit,
+    so added is what the block itself took on top of what was resident.
+    """
+
+    def __init__(self, children=False):
+        self.children = children
+        self.start = None
+        self.peak = None
+        self.done = Event()
+
+    def _update(self):
+        rss = current_rss(self.children)
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def _sample(self):
+        while True:
+            self._update()
+            if self.done.wait(SAMPLE_SECS):
+                break
+
+    @property
+    def added(self):
+        if self.start is None or self.peak is None:
+            return None
+        return self.peak - self.start
+
+    def __enter__(self):
+        self.start = current_rss(self.children)
+        self.peak = self.start
+        self.done.clear()
+        self.thread = Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+        # A block shorter than SAMPLE_SECS still counts what it left resident
+        self._update()
+
+# ================= STAGES ================= #
+
+def pixel_bytes(img):
+    return img.width * img.height * MODE_BYTES.get(img.mode, 4)
+
+def run_stages_once(path, job, logo, overlays=None):
+    """One pass through every stage; returns {stage: (seconds, bytes in, RSS added)}.
+
+    Each stage runs under its own PeakRSS: RSS added is that stage's peak
+    minus the RSS when it started, None where RSS cannot be read.
+    """
+    t = {}
+
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        src = Image.open(path)
+        img, size = open_for_job(src, job)
+        img.load()
+        secs = time.perf_counter() - start
+    t["decode"] = (secs, os.path.getsize(path), rss.added)
+
+    n = pixel_bytes(img)
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        img = apply_adjustments(img, job['brightness'], job['contrast'], job['saturation'], job['sharpness'])
+        secs = time.perf_counter() - start
+    t["adjust"] = (secs, n, rss.added)
+
+    n = pixel_bytes(img)
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        if size != img.size:
+            img = img.resize(size, Image.LANCZOS)
+        secs = time.perf_counter() - start
+    t["resize"] = (secs, n, rss.added)
+
+    n = pixel_bytes(img)
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        img = apply_overlay(img, logo, "Bottom-Right", overlays)
+        secs = time.perf_counter() - start
+    t["overlay"] = (secs, n, rss.added)
+
+    n = pixel_bytes(img)
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        buf = io.BytesIO()
+        save_image(img, buf, job['format'], job['encoder'])
+        secs = time.perf_counter() - start
+    t["encode"] = (secs, n, rss.added)
+
+    src.close()
+    return t
+
+def bench_stages(paths, job, repeat=3):
+    """Per-stage throughput over the corpus, best of repeat per file.
+
+    MB/s is compressed file bytes for decode and decoded pixel bytes going
+    into the stage for everything else. The memory column is the most RSS
+    any one run of the stage added over what was resident when it began.
+    """
+    logo = make_logo()
+    # Shared like in a batch: repeats of a size hit the scaled logo
+    overlays = OverlayCache()
+    totals = {stage: [0.0, 0] for stage in STAGES}
+    peaks = {stage: None for stage in STAGES}
+
+    for path in paths:
+        best = {}
+        for _ in range(repeat):
+            times = run_stages_once(path, job, logo, overlays)
+            for stage, (secs, n, added) in times.items():
+                if stage not in best or secs < best[stage][0]:
+                    best[stage] = (secs, n)
+                if added is not None and (peaks[stage] is None or added > peaks[stage]):
+                    peaks[stage] = added
+        for stage, (secs, n) in best.items():
+            totals[stage][0] += secs
+            totals[stage][1] += n
+
+    results = {}
+    for stage in STAGES:
+        secs, n = totals[stage]
+        results[stage] = rates(secs, len(paths), n, peaks[stage], "stage_rss_mb")
+    return results
+
+def bench_batch(paths, job, workers_list, repeat=1):
+    """Whole runs through run_batch per worker count, best of repeat"""
+    results = {}
+    n = sum(os.path.getsize(p) for p in paths)
+    for workers in sorted(set(workers_list)):
+        best = None
+        peak = None
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as out:
+                with PeakRSS(children=True) as rss:
+                    start = time.perf_counter()
+                    failures, _ = run_batch(list(paths), out, job, workers)
+                    secs = time.perf_counter() - start
+            if failures:
+                raise RuntimeError(f"batch failed: {failures[0]}")
+            best = secs if best is None else min(best, secs)
+            if rss.peak is not None:
+                peak = max(peak or 0, rss.peak)
+        results[str(workers)] = rates(best, len(paths), n, peak)
+    return results
+
+def bench_encoders(paths, job, formats, profiles, repeat=3):
+    """Encode time and output size per format / encoder profile.
+
+    Each file is decoded, adjusted and resized once per the job; then every
+    combination encodes that same image to memory, best of repeat.
+    """
+    logo = make_logo()
+    combos = [(fmt, profile) for fmt in formats for profile in profiles]
+    totals = {combo: [0.0, 0, 0] for combo in combos}   # seconds, pixel bytes, output bytes
+
+    for path in paths:
+        with Image.open(path) as src:
+            img, size = open_for_job(src, job)
+            img = apply_adjustments(img, job['brightness'], job['contrast'], job['saturation'], job['sharpness'])
+            if size != img.size:
+                img = img.resize(size, Image.LANCZOS)
+            img = apply_overlay(img.copy(), logo, "Bottom-Right")
+        n = pixel_bytes(img)
+
+        for fmt, profile in combos:
+            best = None
+            for _ in range(repeat):
+                buf = io.BytesIO()
+                start = time.perf_counter()
+                save_image(img, buf, fmt, profile)
+                secs = time.perf_counter() - start
+                best = secs if best is None else min(best, secs)
+            t = totals[(fmt, profile)]
+            t[0] += best
+            t[1] += n
+            t[2] += buf.tell()
+
+    results = {}
+    for (fmt, profile), (secs, n, out) in totals.items():
+        r = rates(secs, len(paths), n, None)
+        r["output_mb"] = round(out / MB, 2)
+        r["ratio"] = round(out / n, 4) if n else None
+        results[f"{fmt}/{profile}"] = r
+    return results
+
+def rates(secs, images, nbytes, peak, peak_key="peak_rss_mb"):
+    """peak_key names the memory figure: "peak_rss_mb" for a whole run's
+    peak, "stage_rss_mb" for what a single stage added"""
+    return {
+        "seconds": round(secs, 4),
+        "images": images,
+        "images_per_s": round(images / secs, 2) if secs else None,
+        "mb_per_s": round(nbytes / MB / secs, 2) if secs else None,
+        peak_key: round(peak / MB, 1) if peak is not None else None
+    }
+
+# ================= REPORT ================= #
+
+def metadata(args, job, paths):
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "job": job,
+        "corpus": [os.path.basename(p) for p in paths]
+    }
+
+def print_table(title, rows):
+    sizes = any("output_mb" in r for r in rows.values())
+    key, label = ("stage_rss_mb", "+RSS MB") if any("stage_rss_mb" in r for r in rows.values()) else ("peak_rss_mb", "peak MB")
+    print(f"\n{title}")
+    print(f"  {'':<14}{'img/s':>10}{'MB/s':>10}{'seconds':>10}{label:>10}" + (f"{'out MB':>10}{'ratio':>8}" if sizes else ""))
+    for name, r in rows.items():
+        peak = "-" if r.get(key) is None else r[key]
+        line = f"  {name:<14}{r['images_per_s']:>10}{r['mb_per_s']:>10}{r['seconds']:>10}{peak:>10}"
+        if sizes:
+            line += f"{r['output_mb']:>10}{r['ratio']:>8}"
+        print(line)
+
+def compare(old, new, threshold):
+    """Print images/s changes against an earlier run; returns the regressions"""
+    regressions = []
+    print(f"\nCompared with {old['meta']['time']} (Pillow {old['meta']['pillow']}):")
+    for section in ("stages", "batch", "encoders"):
+        for name, r in new.get(section, {}).items():
+            before = old.get(section, {}).get(name)
+            if not before or not before["images_per_s"] or not r["images_per_s"]:
+                continue
+            change = r["images_per_s"] / before["images_per_s"] - 1
+            flag = ""
+            if change < -threshold:
+                flag = "  <-- regression"
+                regressions.append(f"{section}/{name}")
+            size = ""
+            if r.get("output_mb") and before.get("output_mb"):
+                size = f"  size {r['output_mb'] / before['output_mb'] - 1:+.1%}"
+            print(f"  {section}/{name:<14}{before['images_per_s']:>10} -> {r['images_per_s']:<10}{change:+.1%}{size}{flag}")
+    if old["meta"].get("corpus") != new["meta"].get("corpus") or old["meta"].get("job") != new["meta"].get("job"):
+        print("  (warning: corpus or job differ between runs)")
+    return regressions
+
+# ================= CLI ================= #
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="GK Image Tool - conversion benchmark")
+    p.add_argument("--corpus", default=DEFAULT_CORPUS,
+                   help=f"folder for the generated corpus, reused between runs (default: {DEFAULT_CORPUS})")
+    p.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    p.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    p.add_argument("--exts", nargs="+", choices=list(SUPPORTED_EXT), default=list(SUPPORTED_EXT))
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--repeat", type=int, default=3, help="runs per measurement; the best is kept")
+    p.add_argument("--workers", nargs="*", type=int, default=[1, os.cpu_count()],
+                   help="worker counts for the batch section (none to skip it)")
+    p.add_argument("-c", "--config", help="config.json to read the job spec from")
+    p.add_argument("-f", "--format", choices=FORMATS, type=str.upper)
+    p.add_argument("-e", "--encoder", choices=list(ENCODER_PROFILES))
+    p.add_argument("--encoders", nargs="*", choices=FORMATS, type=str.upper, metavar="FORMAT",
+                   help="also compare encoder profiles for these formats (all if none given)")
+    p.add_argument("--width", type=int)
+    p.add_argument("--height", type=int)
+    p.add_argument("-o", "--output", help="write results to this JSON file")
+    p.add_argument("--compare", help="earlier results JSON to compare against")
+    p.add_argument("--threshold", type=float, default=0.10,
+                   help="images/s drop that counts as a regression (default: 0.10)")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    cfg = load_job(args.config) if args.config else BENCH_JOB
+    job = make_job(cfg, **{
+        k: getattr(args, k) for k in ("format", "encoder", "width", "height") if getattr(args, k) is not None
+    })
+
+    paths = make_corpus(args.corpus, corpus_spec(args.sizes, args.modes, args.exts), args.seed)
+    print(f"Corpus: {len(paths)} images in {args.corpus}")
+
+    results = {"meta": metadata(args, job, paths)}
+    results["stages"] = bench_stages(paths, job, args.repeat)
+    print_table("Stages (single image at a time)", results["stages"])
+    if args.workers:
+        results["batch"] = bench_batch(paths, job, args.workers, max(1, args.repeat // 2))
+        print_table("Batch (workers)", results["batch"])
+    if args.encoders is not None:
+        formats = args.encoders or FORMATS
+        results["encoders"] = bench_encoders(paths, job, formats, list(ENCODER_PROFILES), args.repeat)
+        print_table("Encoders (format/profile)", results["encoders"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            old = json.load(f)
+        if compare(old, results, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+
+# ================= HASHING ================= #
+
+def file_digest(path, chunk=1 << 20):
+    """sha256 of a file's bytes, read in chunks"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def job_digest(job):
+    """Stable hash of a normalized job spec"""
+    return hashlib.sha256(json.dumps(job, sort_keys=True).encode()).hexdigest()
+
+def normalize_job(job):
+    """The part of a job spec that determines the encoded bytes.
+
+    prefix only affects the output file name, and slider values are rounded
+    so 1.0000001 and 1.0 share an entry.
+    """
+    return {
+        k: round(v, 4) if isinstance(v, float) else v
+        for k, v in job.items() if k != "prefix"
+    }
+
+def trim_dir(root, max_bytes):
+    """Delete the least recently used files under root until under max_bytes"""
+    entries = []
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            p = os.path.join(dirpath, name)
+            try:
+                st = os.stat(p)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, p in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def _write_json(path, data):
+    # Write-then-rename so an interrupted run never leaves a truncated file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+# ================= INCREMENTAL MANIFEST ================= #
+
+MANIFEST_FILE = ".gk_manifest.json"
+MANIFEST_FLUSH_SECS = 30
+
+class Manifest:
+    """Record of what each source was converted to, kept in the output folder.
+
+    Entries map a source path to its size, mtime, content hash, the hash of
+    the job spec used and the output paths. A source is up to date when its
+    outputs still exist, the job hash matches and either size+mtime are
+    unchanged or (only if the mtime moved) its content hash still matches.
+    """
+
+    def __init__(self, output_folder):
+        self.path = os.path.join(output_folder, MANIFEST_FILE)
+        self.entries = {}
+        self.last_flush = time.monotonic()
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def is_current(self, src, out_paths, job):
+        entry = self.entries.get(os.path.abspath(src))
+        if not entry or entry["job"] != job_digest(job) or entry["outputs"] != out_paths:
+            return False
+        if not all(os.path.exists(p) for p in out_paths):
+            return False
+
+        st = os.stat(src)
+        if st.st_size != entry["size"]:
+            return False
+        if st.st_mtime_ns == entry["mtime"]:
+            return True
+        # Touched (copied, restored from backup...) but maybe not changed
+        if file_digest(src) == entry["hash"]:
+            entry["mtime"] = st.st_mtime_ns
+            return True
+        return False
+
+    def record(self, src, out_paths, job, digest=None):
+        st = os.stat(src)
+        self.entries[os.path.abspath(src)] = {
+            "size": st.st_size,
+            "mtime": st.st_mtime_ns,
+            "hash": digest or file_digest(src),
+            "job": job_digest(job),
+            "outputs": out_paths
+        }
+        if time.monotonic() - self.last_flush > MANIFEST_FLUSH_SECS:
+            self.save()
+
+    def save(self):
+        _write_json(self.path, self.entries)
+        self.last_flush = time.monotonic()
+
+# ================= RESULT CACHE ================= #
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "gk_imconvert", "results")
+CACHE_MAX_MB = 2048
+
+class ResultCache:
+    """Content-addressed store of encoded outputs shared across sessions.
+
+    Entries are keyed by sha256(source bytes) + the normalized job spec, so
+    an identical file exported with identical settings is served by copying
+    (or hard-linking, with link=True) the stored results instead of decoding
+    and encoding again. A fan-out job stores one file per output under the
+    same key. Hits refresh the entry's mtime; trim() evicts the
+    least recently used entries beyond max_mb. Safe to share between worker
+    processes: entries are written with an atomic rename.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_mb=CACHE_MAX_MB, link=False):
+        self.root = root
+        self.max_bytes = max_mb * 1024 * 1024
+        self.link = link
+
+    def key(self, digest, job):
+        return hashlib.sha256(f"{digest}:{job_digest(normalize_job(job))}".encode()).hexdigest()
+
+    def path(self, key, index=0):
+        return os.path.join(self.root, key[:2], f"{key}.{index}")
+
+    def fetch(self, key, out_paths):
+        """Materialize cached results at out_paths; False on a miss"""
+        srcs = [self.path(key, i) for i in range(len(out_paths))]
+        try:
+            for src in srcs:
+                os.utime(src)
+        except FileNotFoundError:
+            return False
+        for src, out_path in zip(srcs, out_paths):
+            # Per process: two sources can map to the same output name
+            tmp = f"{out_path}.{os.getpid()}.tmp"
+            try:
+                if self.link:
+                    os.link(src, tmp)
+                else:
+                    shutil.copyfile(src, tmp)
+            except OSError:
+                # Evicted meanwhile, or hard links unsupported on this volume
+                if not self.link or not os.path.exists(src):
+                    return False
+                shutil.copyfile(src, tmp)
+            os.replace(tmp, out_path)
+        return True
+
+    def store(self, key, out_paths):
+        for i, out_path in enumerate(out_paths):
+            dst = self.path(key, i)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            tmp = f"{dst}.{os.getpid()}.tmp"
+            shutil.copyfile(out_path, tmp)
+            os.replace(tmp, dst)
+
+    def trim(self):
+        """Evict least recently used entries until under max_mb"""
+        trim_dir(self.root, self.max_bytes)
+
+# ================= THUMBNAIL CACHE ================= #
+
+THUMB_DIR = os.path.join(os.path.expanduser("~"), ".cache", "gk_imconvert", "thumbs")
+THUMB_MAX_MB = 256
+
+class ThumbnailCache:
+    """Browser thumbnails kept on disk between sessions.
+
+    A thumbnail is keyed by the source's absolute path, its mtime and the
+    thumbnail size, so an edited file gets a new one and stale entries are
+    simply never hit again; trim() drops the least recently used.
+    """
+
+    def __init__(self, root=THUMB_DIR, max_mb=THUMB_MAX_MB):
+        self.root = root
+        self.max_bytes = max_mb * 1024 * 1024
+
+    def path(self, src, size, mtime_ns=None):
+        """Where the thumbnail of src belongs (stats src unless mtime_ns is given)"""
+        if mtime_ns is None:
+            mtime_ns = os.stat(src).st_mtime_ns
+        key = hashlib.sha1(f"{os.path.abspath(src)}:{mtime_ns}:{size}".encode()).hexdigest()
+        return os.path.join(self.root, key[:2], f"{key}.webp")
+
+    def trim(self):
+        trim_dir(self.root, self.max_bytes)
@@ -0,0 +1,1509 @@
+from PIL import Image, ImageEnhance
+import io
+import os
+import sys
+import json
+import math
+import struct
+import time
+import signal
+import argparse
+import traceback
+import multiprocessing
+from threading import Thread, Event, Lock, Semaphore, Condition, get_ident
+from contextlib import nullcontext
+from collections import OrderedDict
+from queue import Queue, Empty
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from gk_cache import Manifest, ResultCache, CACHE_DIR, CACHE_MAX_MB, file_digest
+
+# ================= CONFIG ================= #
+# Headless processing engine shared by the GUI versions and the batch CLI.
+# Nothing in here may import tkinter / customtkinter.
+
+SUPPORTED_EXT = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tiff")
+
+PRESETS = {
+    "Instagram Post (1:1)": (1080, 1080),
+    "Instagram Story / Reel (9:16)": (1080, 1920),
+    "YouTube Thumbnail (16:9)": (1280, 720),
+    "Facebook Post (1200x630)": (1200, 630),
+    "Twitter Post (1200x675)": (1200, 675)
+}
+
+FORMATS = ["PNG", "JPG", "WEBP"]
+
+# Encoder settings per format. "balanced" is what every version has always
+# written (JPEG quality 95, PNG and WEBP at Pillow defaults); compare the
+# others on your own images with gk_bench.py --encoders.
+ENCODER_PROFILES = {
+    "fast": {
+        "PNG": {"compress_level": 1},
+        "JPG": {"quality": 90, "subsampling": 2},
+        "WEBP": {"quality": 80, "method": 0}
+    },
+    "balanced": {
+        "PNG": {},
+        "JPG": {"quality": 95},
+        "WEBP": {}
+    },
+    "smallest": {
+        "PNG": {"compress_level": 9, "optimize": True},
+        "JPG": {"quality": 85, "subsampling": 2, "progressive": True, "optimize": True},
+        "WEBP": {"quality": 75, "method": 6}
+    }
+}
+
+# Target file size mode (job["max_kb"]): quality is bisected between
+# MIN_QUALITY and the profile's quality in at most SIZE_SEARCH_STEPS encodes
+# after the first. Only lossy formats have a quality to search.
+SIZE_FORMATS = ("JPG", "WEBP")
+DEFAULT_QUALITY = {"JPG": 75, "WEBP": 80}
+MIN_QUALITY = 10
+SIZE_SEARCH_STEPS = 7
+
+# A job spec is a plain dict; keys mirror config.json so a saved config
+# can be passed straight to make_job()
+DEFAULT_JOB = {
+    "format": "PNG",
+    "keep_ratio": True,
+    "prefix": "gk_",
+    "brightness": 1.0,
+    "contrast": 1.0,
+    "saturation": 1.0,
+    "sharpness": 1.0,
+    "width": None,
+    "height": None,
+    "draft": True,
+    "presets": [],
+    "encoder": "balanced",
+    "max_kb": None
+}
+
+# Reduce-on-load keeps the decoded image at least this many times larger
+# than the target, so the final LANCZOS pass still has real detail to work
+# with (same gap Pillow's own thumbnail() uses)
+REDUCING_GAP = 2
+
+def make_job(cfg=None, **overrides):
+    """Build a complete job spec from a config dict plus overrides"""
+    job = DEFAULT_JOB.copy()
+    for src in (cfg or {}, overrides):
+        for k, v in src.items():
+            if k in DEFAULT_JOB and v is not None:
+                job[k] = v
+    job["format"] = str(job["format"]).upper()
+    if job["format"] not in FORMATS:
+        raise ValueError(f"Unsupported format: {job['format']}")
+    if job["max_kb"]:
+        try:
+            job["max_kb"] = int(job["max_kb"])
+        except (TypeError, ValueError):
+            job["max_kb"] = 0
+        if job["max_kb"] <= 0:
+            raise ValueError("Target size must be a whole number of KB")
+    else:
+        job["max_kb"] = None
+    if job["encoder"] not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile: {job['encoder']}")
+    job["presets"] = list(job["presets"])
+    for name in job["presets"]:
+        if name not in PRESETS:
+            raise ValueError(f"Unknown preset: {name}")
+    return job
+
+def load_job(config_file):
+    """Read a job spec from a config.json file"""
+    with open(config_file, "r") as f:
+        return make_job(json.load(f))
+
+# ================= IMAGE PROCESSING ================= #
+
+# Luma weights used by convert("L") (ITU-R 601-2)
+LUMA = (0.299, 0.587, 0.114)
+
+def _f32(v):
+    return struct.unpack("f", struct.pack("f", v))[0]
+
+def _blend8(a, b, factor):
+    """One channel value of Image.blend(a, b, factor): float32 math, truncated and clipped"""
+    v = _f32(a + _f32(_f32(factor) * (b - a)))
+    return 0 if v <= 0 else 255 if v >= 255 else int(v)
+
+def tone_lut(img, brightness=1.0, contrast=1.0):
+    """Single 256-entry LUT equal to ImageEnhance Brightness then Contrast.
+
+    Contrast blends towards the mean grey of the brightened image, taken
+    like ImageEnhance.Contrast does: every pixel rounded to L first, then
+    the mean rounded. A mean from per-channel averages can land one level
+    off, which high contrast and saturation amplify. Returns None when both
+    are neutral.
+    """
+    if brightness == 1.0 and contrast == 1.0:
+        return None
+
+    lut = [_blend8(0, v, brightness) for v in range(256)]
+    if contrast != 1.0:
+        bright = img if brightness == 1.0 else img.point(channel_lut(img, lut))
+        hist = bright.convert("L").histogram()
+        n = img.width * img.height
+        mean = int(sum(v * h for v, h in enumerate(hist)) / n + 0.5)
+        lut = [_blend8(mean, v, contrast) for v in lut]
+    return lut
+
+def channel_lut(img, lut):
+    """Image.point table applying lut to the colour bands and leaving alpha alone"""
+    return lut * 3 + list(range(256)) * (len(img.getbands()) - 3)
+
+def saturation_matrix(saturation):
+    """convert() matrix blending each channel towards luma, like ImageEnhance.Color"""
+    matrix = []
+    for c in range(3):
+        matrix += [(1 - saturation) * w + (saturation if j == c else 0) for j, w in enumerate(LUMA)]
+        matrix.append(0)
+    return matrix
+
+def apply_tone(img, brightness=1.0, contrast=1.0, saturation=1.0):
+    """Brightness, contrast and saturation on an RGB(A) image in two C passes.
+
+    Brightness and contrast are folded into one lookup table (Image.point);
+    saturation is a single 3x4 colour-matrix convert. Matches the
+    ImageEnhance chain within +-1 level while touching the pixels twice
+    instead of allocating a blended full-size image per factor (plus a
+    brightened copy for the contrast mean when both are set).
+    """
+    lut = tone_lut(img, brightness, contrast)
+    if lut:
+        img = img.point(channel_lut(img, lut))
+
+    if saturation != 1.0:
+        matrix = saturation_matrix(saturation)
+        if img.mode == 'RGBA':
+            alpha = img.getchannel('A')
+            img = img.convert('RGB').convert('RGB', matrix)
+            img.putalpha(alpha)
+        else:
+            img = img.convert('RGB', matrix)
+    return img
+
+def apply_sharpness(img, sharpness=1.0):
+    return ImageEnhance.Sharpness(img).enhance(sharpness)
+
+# Ordered adjustment stages as (number of factors, function); every factor
+# is neutral at 1.0 and a stage with all-neutral factors is skipped
+ADJUSTMENT_STAGES = [
+    (3, apply_tone),        # brightness, contrast, saturation
+    (1, apply_sharpness)    # sharpness
+]
+
+def run_stages(img, params, first=0):
+    """Apply ADJUSTMENT_STAGES[first:], yielding (params through stage, img)"""
+    i = sum(n for n, _ in ADJUSTMENT_STAGES[:first])
+    for n, fn in ADJUSTMENT_STAGES[first:]:
+        values = params[i:i + n]
+        i += n
+        if any(v != 1.0 for v in values):
+            img = fn(img, *values)
+        yield params[:i], img
+
+def apply_adjustments(img, brightness=1.0, contrast=1.0, saturation=1.0, sharpness=1.0):
+    """Apply color corrections to image safely"""
+    try:
+        if img is None or img.size[0] == 0 or img.size[1] == 0:
+            return img
+
+        # Convert to RGB if needed
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGB')
+
+        for _, img in run_stages(img, (brightness, contrast, saturation, sharpness)):
+            pass
+
+        return img
+    except Exception as e:
+        print(f"Error applying adjustments: {e}")
+        return img
+
+class AdjustmentPipeline:
+    """apply_adjustments with every stage's output memoized.
+
+    Each stage is cached under (source, params of that stage and all before
+    it), so changing one factor only recomputes its stage and the ones
+    after it; e.g. dragging sharpness reuses the cached tone output. Only
+    the latest result per stage is kept, which is what a slider drag needs.
+    Returned images are shared with the cache and must not be modified in
+    place.
+    """
+
+    def __init__(self):
+        self.source = None
+        self.base = None
+        self.stages = []   # [(params up to and including this stage, img)]
+
+    def render(self, img, brightness=1.0, contrast=1.0, saturation=1.0, sharpness=1.0,
+               stale=None):
+        """Adjusted img; returns None if stale() turns true between stages"""
+        if img is None or img.size[0] == 0 or img.size[1] == 0:
+            return img
+
+        if img is not self.source:
+            self.source = img
+            self.base = img if img.mode in ('RGB', 'RGBA') else img.convert('RGB')
+            self.stages = []
+
+        params = (brightness, contrast, saturation, sharpness)
+        out = self.base
+        first = 0
+        for key, cached in self.stages:
+            if key != params[:len(key)]:
+                break
+            out = cached
+            first += 1
+        del self.stages[first:]
+
+        for key, out in run_stages(out, params, first):
+            self.stages.append((key, out))
+            if stale and stale():
+                return None
+        return out
+
+class PreviewRenderer:
+    """Runs preview renders on one background thread; the newest request wins.
+
+    request() bumps a generation counter and replaces any request not yet
+    started. render(*args, stale=...) runs on the worker and may return None
+    early once stale() is true. deliver(generation, img) is called from the
+    worker for results that are still current; GUI callers must hand it to
+    their UI thread and drop it there if is_current(generation) is false by
+    then.
+    """
+
+    def __init__(self, render, deliver):
+        self.render = render
+        self.deliver = deliver
+        self.generation = 0
+        self.pending = None
+        self.cond = Condition()
+        Thread(target=self._run, daemon=True).start()
+
+    def request(self, *args):
+        with self.cond:
+            self.generation += 1
+            self.pending = (self.generation, args)
+            self.cond.notify()
+            return self.generation
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                generation, args = self.pending
+                self.pending = None
+
+            stale = lambda: generation != self.generation
+            try:
+                img = self.render(*args, stale=stale)
+            except Exception as e:
+                print(f"Preview error: {e}")
+                continue
+            if img is not None and not stale():
+                self.deliver(generation, img)
+
+class Prefetcher:
+    """Loads keys ahead of use on background threads into a bounded LRU.
+
+    prefetch(keys) replaces the wanted list, most urgent first; workers
+    load(key) whatever of it is neither cached nor already loading, and
+    hand each result (None if it failed) to on_ready(key, value) from the
+    worker thread. get(key) never blocks. Values are evicted least recently
+    used once their size_of() total passes max_bytes, but never while
+    still wanted.
+    """
+
+    def __init__(self, load, on_ready=None, max_bytes=None, size_of=None, workers=2):
+        self.load = load
+        self.on_ready = on_ready
+        self.max_bytes = max_bytes
+        self.size_of = size_of or (lambda value: 0)
+        self.cache = OrderedDict()   # key -> value, LRU
+        self.sizes = {}
+        self.total = 0
+        self.wanted = []
+        self.loading = set()
+        self.cond = Condition()
+        for _ in range(workers):
+            Thread(target=self._run, daemon=True).start()
+
+    def prefetch(self, keys):
+        with self.cond:
+            self.wanted = list(keys)
+            self.cond.notify_all()
+
+    def get(self, key):
+        """The cached value for key, or None"""
+        with self.cond:
+            value = self.cache.get(key)
+            if value is not None:
+                self.cache.move_to_end(key)
+            return value
+
+    def _next(self):
+        for key in self.wanted:
+            if key not in self.cache and key not in self.loading:
+                return key
+        return None
+
+    def _run(self):
+        while True:
+            with self.cond:
+                key = self.cond.wait_for(self._next)
+                self.loading.add(key)
+
+            try:
+                value = self.load(key)
+            except Exception as e:
+                print(f"Prefetch error {key}: {e}")
+                value = None
+
+            with self.cond:
+                self.loading.discard(key)
+                if value is None:
+                    # Not retried until it is asked for again
+                    self.wanted = [k for k in self.wanted if k != key]
+                else:
+                    self.cache[key] = value
+                    self.sizes[key] = self.size_of(value)
+                    self.total += self.sizes[key]
+                    self._evict()
+            if self.on_ready:
+                self.on_ready(key, value)
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        for key in list(self.cache):
+            if self.total <= self.max_bytes:
+                break
+            if key not in self.wanted:
+                del self.cache[key]
+                self.total -= self.sizes.pop(key)
+
+def overlay_position(size, logo_size, pos):
+    w, h = size
+    lw, lh = logo_size
+    return {
+        "Top-Left": (10, 10),
+        "Top-Right": (w - lw - 10, 10),
+        "Bottom-Left": (10, h - lh - 10),
+        "Bottom-Right": (w - lw - 10, h - lh - 10)
+    }[pos]
+
+def prepare_overlay(logo, size, mode, pos):
+    """Logo ready to paste on a size / mode image at pos: (image, mask, box).
+
+    The logo is scaled to 1/6 of the width and cropped to its visible
+    pixels. On RGB targets it is premultiplied (RGBa) and acts as its own
+    mask, which Pillow blends in one pass; other modes get the logo in
+    their mode plus its alpha band.
+    """
+    logo = logo.copy()
+    scale = size[0] // 6
+    logo.thumbnail((scale, scale))
+    x, y = overlay_position(size, logo.size, pos)
+
+    if logo.mode != "RGBA":
+        return logo.convert(mode), None, (x, y)
+
+    alpha = logo.getchannel("A")
+    bbox = alpha.getbbox()
+    if bbox is None:
+        return None
+    if bbox != (0, 0) + logo.size:
+        logo = logo.crop(bbox)
+        alpha = alpha.crop(bbox)
+    box = (x + bbox[0], y + bbox[1])
+
+    if mode == "RGB":
+        logo = logo.convert("RGBa")
+        return logo, logo, box
+    return (logo if mode == "RGBA" else logo.convert(mode)), alpha, box
+
+class OverlayCache:
+    """prepare_overlay results for one logo, per output size, mode and position.
+
+    A batch of same-sized images then only pays for the paste. Selecting a
+    different logo object drops the entries. Safe to share between threads.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.logo = None
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, logo, size, mode, pos):
+        key = (size, mode, pos)
+        with self.lock:
+            if logo is not self.logo:
+                self.logo = logo
+                self.entries.clear()
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        prepared = prepare_overlay(logo, size, mode, pos)
+        with self.lock:
+            if logo is self.logo:
+                self.entries[key] = prepared
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return prepared
+
+def apply_overlay(img, logo, pos, cache=None):
+    """Paste logo (scaled to 1/6 of the width) into a corner of img, in place.
+
+    cache is an optional OverlayCache, for batches.
+    """
+    if logo:
+        if cache is None:
+            prepared = prepare_overlay(logo, img.size, img.mode, pos)
+        else:
+            prepared = cache.get(logo, img.size, img.mode, pos)
+        if prepared is not None:
+            overlay, mask, box = prepared
+            img.paste(overlay, box, mask)
+    return img
+
+def get_resize_size(size, width=None, height=None, keep_ratio=True):
+    """Get target (w, h) for a source size; blank width/height keeps original"""
+    try:
+        if not width or not height:
+            return size
+
+        w, h = int(width), int(height)
+
+        if keep_ratio and w > 0:
+            ratio = size[0] / size[1]
+            h = max(1, int(w / ratio))
+
+        return max(1, w), max(1, h)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return size
+
+def fit_size(size, bound):
+    """size scaled down (never up) to fit in a bound x bound box"""
+    w, h = size
+    scale = min(1.0, bound / w, bound / h)
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+def output_ext(fmt):
+    ext = fmt.lower()
+    if ext == "jpg":
+        ext = "jpeg"
+    return ext
+
+def output_name(path, job):
+    """Output file name for a source path: {prefix}{name}.{ext}"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return f"{job['prefix']}{name}.{output_ext(job['format'])}"
+
+def preset_sizes(job):
+    """Distinct (w, h) of the job's fan-out presets, in job order"""
+    return list(dict.fromkeys(PRESETS[name] for name in job['presets']))
+
+def output_paths(path, output_folder, job):
+    """Output paths for a source: one file, or one per fan-out preset size.
+
+    Fan-out outputs are exactly their preset size (see crop_box), so the
+    _{w}x{h} suffix is the size of the image in the file.
+    """
+    name = output_name(path, job)
+    if not job['presets']:
+        return [os.path.join(output_folder, name)]
+    base, ext = os.path.splitext(name)
+    return [os.path.join(output_folder, f"{base}_{w}x{h}{ext}") for w, h in preset_sizes(job)]
+
+def crop_box(size, target, keep_ratio=True):
+    """Region of a size image that fan-out scales to exactly target.
+
+    With keep_ratio it is the centered region with target's aspect ratio:
+    the image is scaled to cover target and the overflow cropped, so no
+    preset is distorted or letterboxed. Without it, the whole image is
+    stretched to target.
+    """
+    w, h = size
+    if not keep_ratio:
+        return (0, 0, w, h)
+    scale = max(target[0] / w, target[1] / h)
+    cw, ch = target[0] / scale, target[1] / scale
+    x0, y0 = (w - cw) / 2, (h - ch) / 2
+    return (x0, y0, x0 + cw, y0 + ch)
+
+def fanout_load_size(size, job):
+    """Smallest size of a size image whose crop_box is at least its target, for every preset"""
+    need_w = need_h = 0
+    for t in preset_sizes(job):
+        x0, y0, x1, y1 = crop_box(size, t, job['keep_ratio'])
+        need_w = max(need_w, math.ceil(size[0] * t[0] / (x1 - x0)))
+        need_h = max(need_h, math.ceil(size[1] * t[1] / (y1 - y0)))
+    return need_w, need_h
+
+def reduce_for_target(img, size, gap=REDUCING_GAP):
+    """Shrink a freshly opened image towards size before it is processed.
+
+    JPEGs are decoded at a reduced DCT scale (draft mode), which also cuts
+    peak memory; other formats are box-reduced by an integer factor right
+    after decoding. Images not at least gap x the target are left alone.
+    """
+    tw, th = size[0] * gap, size[1] * gap
+    if img.width < tw or img.height < th:
+        return img
+
+    if img.format == "JPEG":
+        img.draft(img.mode, (tw, th))
+
+    factor = min(img.width // tw, img.height // th)
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+def target_size(img, job):
+    return get_resize_size(img.size, job['width'], job['height'], job['keep_ratio'])
+
+def open_for_job(img, job):
+    """Decode an opened image for a job; returns (img, final target size)"""
+    size = target_size(img, job)
+    if job.get('draft', True) and size != img.size:
+        img = reduce_for_target(img, size)
+    return img, size
+
+def make_thumbnail(path, size):
+    """Decode path straight to a thumbnail fitting size x size.
+
+    JPEGs are decoded at reduced DCT scale (draft) and everything else is
+    box-reduced before the final resample, so even huge scans are cheap.
+    """
+    with Image.open(path) as img:
+        img.draft(img.mode, (size, size))
+        mode = "RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB"
+        if img.mode not in ("RGB", "RGBA", "L"):
+            # Palette / 1-bit / 16-bit would be resized with NEAREST or not at all
+            img = img.convert(mode)
+        img.thumbnail((size, size), Image.BILINEAR, reducing_gap=REDUCING_GAP)
+        # A new image, so it survives the source being closed
+        return img.convert(mode)
+
+def cached_thumbnail(path, size, cache=None):
+    """make_thumbnail through a gk_cache.ThumbnailCache, when given"""
+    if cache is None:
+        return make_thumbnail(path, size)
+
+    dst = cache.path(path, size)
+    try:
+        thumb = Image.open(dst)
+        thumb.load()
+        os.utime(dst)
+        return thumb
+    except OSError:
+        pass
+
+    thumb = make_thumbnail(path, size)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = f"{dst}.{os.getpid()}.{get_ident()}.tmp"
+    try:
+        thumb.save(tmp, "WEBP", quality=80)
+        os.replace(tmp, dst)
+    except OSError:
+        # A read-only or full cache volume must not break browsing
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return thumb
+
+def process_image(img, job, size=None, timer=None):
+    """Adjust and resize an image according to a job spec.
+
+    size overrides the target computed from img, e.g. when img was already
+    reduced on load. timer is an optional StageTimer.
+    """
+    with timed(timer, "adjust"):
+        processed = apply_adjustments(
+            img,
+            job['brightness'],
+            job['contrast'],
+            job['saturation'],
+            job['sharpness']
+        )
+
+    size = size or target_size(processed, job)
+    if size != processed.size:
+        with timed(timer, "resize"):
+            processed = processed.resize(size, Image.LANCZOS)
+    return processed
+
+def fanout_images(img, job, timer=None):
+    """One processed image per fan-out preset (aligned with preset_sizes) from one decode.
+
+    Every image is exactly its preset size: its crop_box of the source,
+    scaled. The source is reduced on load as far as the most demanding
+    crop allows (closing img to free the full-size decode) and adjusted
+    once. Targets are then made largest first from box-reduced
+    intermediates of the adjusted image (per-axis integer factors that keep
+    the crop at least REDUCING_GAP x the target), shared between targets
+    that need the same reduction, so every final LANCZOS pass runs on a
+    small image.
+    """
+    targets = preset_sizes(job)
+    with timed(timer, "decode"):
+        if job.get('draft', True):
+            src = reduce_for_target(img, fanout_load_size(img.size, job))
+            if src is not img:
+                img.close()
+            img = src
+        img.load()
+
+    with timed(timer, "adjust"):
+        base = apply_adjustments(
+            img,
+            job['brightness'],
+            job['contrast'],
+            job['saturation'],
+            job['sharpness']
+        )
+
+    reduced = {(1, 1): base}
+    made = {}
+    with timed(timer, "resize"):
+        for t in sorted(targets, key=lambda t: t[0] * t[1], reverse=True):
+            x0, y0, x1, y1 = crop_box(base.size, t, job['keep_ratio'])
+            factor = (
+                max(1, int((x1 - x0) // (t[0] * REDUCING_GAP))),
+                max(1, int((y1 - y0) // (t[1] * REDUCING_GAP)))
+            )
+            if factor not in reduced:
+                reduced[factor] = base.reduce(factor)
+            src = reduced[factor]
+            # reduce() drops the remainder pixels, so clamp the far edges
+            box = (
+                x0 / factor[0], y0 / factor[1],
+                min(x1 / factor[0], src.width), min(y1 / factor[1], src.height)
+            )
+            if src.size == t and box == (0, 0) + src.size:
+                made[t] = src
+            else:
+                made[t] = src.resize(t, Image.LANCZOS, box=box)
+    return [made[t] for t in targets]
+
+def save_image(img, path, fmt, profile="balanced", **overrides):
+    """Save with proper format handling and the encoder profile's settings"""
+    options = {**ENCODER_PROFILES[profile][fmt], **overrides}
+    if fmt == "JPG":
+        # convert() would copy an image that is already RGB
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        img.save(path, "JPEG", **options)
+    else:
+        img.save(path, fmt, **options)
+
+def encode_to_size(img, fmt, max_bytes, profile="balanced", steps=SIZE_SEARCH_STEPS):
+    """Encode img in memory at the highest quality that fits max_bytes.
+
+    The profile's quality is tried first; if it is too big, quality is
+    bisected down to MIN_QUALITY, every attempt re-encoding the same image
+    into a buffer. When nothing fits, the MIN_QUALITY encoding is returned.
+    Returns (data, quality).
+    """
+    options = ENCODER_PROFILES[profile][fmt]
+    if fmt == "JPG" and img.mode != "RGB":
+        img = img.convert("RGB")
+
+    def encode(quality):
+        buf = io.BytesIO()
+        save_image(img, buf, fmt, profile, quality=quality)
+        return buf.getvalue()
+
+    hi = options.get("quality", DEFAULT_QUALITY[fmt])
+    data = encode(hi)
+    if len(data) <= max_bytes:
+        return data, hi
+
+    best = None
+    floor = None
+    lo, hi = MIN_QUALITY, hi - 1
+    while lo <= hi and steps > 0:
+        mid = (lo + hi) // 2
+        data = encode(mid)
+        steps -= 1
+        if len(data) <= max_bytes:
+            best = (data, mid)
+            lo = mid + 1
+        else:
+            hi = mid - 1
+        if mid == MIN_QUALITY:
+            floor = data
+    return best or (floor or encode(MIN_QUALITY), MIN_QUALITY)
+
+def encode_image(img, fmt, profile="balanced", max_kb=None):
+    """Encode img in memory; returns (data, quality) with quality as in write_image"""
+    if max_kb and fmt in SIZE_FORMATS:
+        return encode_to_size(img, fmt, int(max_kb) * 1024, profile)
+    buf = io.BytesIO()
+    save_image(img, buf, fmt, profile)
+    return buf.getvalue(), None
+
+def write_image(img, path, fmt, profile="balanced", max_kb=None):
+    """save_image through a temp file and rename.
+
+    Readers never see a half-written file, and an existing path that is a
+    hard link into the result cache is replaced rather than written through.
+    With max_kb set, JPG / WEBP quality is searched to fit (encode_to_size);
+    returns the quality used then, else None.
+    """
+    # Unique per writer: a.jpg and a.png both become a.webp, possibly at once
+    tmp = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+    quality = None
+    try:
+        if max_kb and fmt in SIZE_FORMATS:
+            data, quality = encode_to_size(img, fmt, int(max_kb) * 1024, profile)
+            with open(tmp, "wb") as f:
+                f.write(data)
+        else:
+            save_image(img, tmp, fmt, profile)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return quality
+
+def convert_file(path, output_folder, job, cache=None, digest=None, timer=None):
+    """Convert a single file; returns the list of output paths.
+
+    With job['presets'] set, every preset size is written from a single
+    decode (see fanout_images). With a gk_cache.ResultCache, an identical
+    source already converted with the same settings is copied from the
+    cache instead. digest is the source's sha256 if the caller already has
+    it. timer is an optional StageTimer recording decode / adjust / resize /
+    encode (and cache) spans.
+    """
+    out_paths = output_paths(path, output_folder, job)
+
+    key = None
+    if cache is not None:
+        with timed(timer, "cache"):
+            key = cache.key(digest or file_digest(path), job)
+            hit = cache.fetch(key, out_paths)
+        if hit:
+            return out_paths
+
+    # Every image is released as soon as it is no longer needed: the source
+    # handle is closed (freeing a full-size decode) before adjusting, and
+    # each output is dropped once written
+    with Image.open(path) as img:
+        if job['presets']:
+            images = fanout_images(img, job, timer)
+        else:
+            with timed(timer, "decode"):
+                src, size = open_for_job(img, job)
+                if src is not img:
+                    img.close()
+                src.load()
+            images = [process_image(src, job, size, timer)]
+            del src
+        for out_path in out_paths:
+            with timed(timer, "encode"):
+                write_image(images.pop(0), out_path, job['format'], job['encoder'], job['max_kb'])
+
+    if key:
+        with timed(timer, "cache"):
+            cache.store(key, out_paths)
+    return out_paths
+
+def convert_to_bytes(fp, job, timer=None):
+    """Convert one image (a path or binary file object) without touching disk.
+
+    Returns (data, quality) as encode_image. Fan-out presets are not
+    applied: the output is the job's own size.
+    """
+    with Image.open(fp) as img:
+        with timed(timer, "decode"):
+            src, size = open_for_job(img, job)
+            if src is not img:
+                img.close()
+            src.load()
+        processed = process_image(src, job, size, timer)
+        del src
+        # Still inside the with: processed may be the source image itself
+        with timed(timer, "encode"):
+            return encode_image(processed, job['format'], job['encoder'], job['max_kb'])
+
+# ================= INSTRUMENTATION ================= #
+
+class StageTimer:
+    """Wall-clock spans of the stages one file goes through.
+
+    Cheap enough to leave on for every file: two clock reads per stage.
+    """
+
+    def __init__(self):
+        self.spans = []   # (stage, start epoch seconds, duration seconds)
+
+    def stage(self, name):
+        return _Span(self.spans, name)
+
+class _Span:
+    def __init__(self, spans, name):
+        self.spans = spans
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.spans.append((self.name, self.start, time.perf_counter() - self.t0))
+
+def timed(timer, name):
+    """timer.stage(name), or a no-op when there is no timer"""
+    return timer.stage(name) if timer is not None else nullcontext()
+
+def _percentile(ordered, q):
+    # Nearest rank on an already sorted list
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class BatchStats:
+    """Per-stage time histograms and throughput for a batch.
+
+    run_batch / run_pipeline feed it the spans each file recorded; other
+    threads (e.g. a UI timer) may read summary() while the batch runs. The
+    full per-file trace is kept for save_trace().
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.samples = {}    # stage -> [seconds per file]
+        self.trace = []      # (path, worker, spans)
+        self.files = 0
+        self.bytes_in = 0
+        self.started = time.time()
+
+    def add(self, path, spans, worker=0, nbytes=0):
+        per_stage = {}
+        for name, _, dur in spans:
+            per_stage[name] = per_stage.get(name, 0.0) + dur
+        with self.lock:
+            for name, dur in per_stage.items():
+                self.samples.setdefault(name, []).append(dur)
+            self.trace.append((path, worker, spans))
+            self.files += 1
+            self.bytes_in += nbytes
+
+    def summary(self):
+        """{files, elapsed, images_per_s, mb_per_s, slowest, stages: {stage: {count, total, p50, p95, max}}}"""
+        with self.lock:
+            samples = {name: sorted(v) for name, v in self.samples.items()}
+            files, nbytes = self.files, self.bytes_in
+        elapsed = max(time.time() - self.started, 1e-9)
+
+        stages = {
+            name: {
+                "count": len(v),
+                "total": sum(v),
+                "p50": _percentile(v, 0.50),
+                "p95": _percentile(v, 0.95),
+                "max": v[-1]
+            }
+            for name, v in samples.items()
+        }
+        return {
+            "files": files,
+            "elapsed": elapsed,
+            "images_per_s": files / elapsed,
+            "mb_per_s": nbytes / (1024 * 1024) / elapsed,
+            # Where most of the work time goes, summed over all workers
+            "slowest": max(stages, key=lambda n: stages[n]["total"]) if stages else None,
+            "stages": stages
+        }
+
+    def format_summary(self):
+        s = self.summary()
+        lines = [
+            f"{s['files']} images in {s['elapsed']:.1f}s - "
+            f"{s['images_per_s']:.2f} img/s, {s['mb_per_s']:.1f} MB/s"
+        ]
+        total = sum(st["total"] for st in s["stages"].values()) or 1
+        for name, st in s["stages"].items():
+            mark = "  <- slowest" if name == s["slowest"] else ""
+            lines.append(
+                f"  {name:<8} p50 {st['p50'] * 1000:7.1f} ms  p95 {st['p95'] * 1000:7.1f} ms  "
+                f"max {st['max'] * 1000:7.1f} ms  {st['total'] / total:5.1%}{mark}"
+            )
+        return "\n".join(lines)
+
+    def save_trace(self, path):
+        """Write the trace as Chrome trace-event JSON (chrome://tracing, Perfetto)"""
+        with self.lock:
+            trace = list(self.trace)
+        events = [
+            {
+                "name": name, "cat": "stage", "ph": "X",
+                "ts": int(start * 1e6), "dur": int(dur * 1e6),
+                "pid": 1, "tid": worker,
+                "args": {"file": src}
+            }
+            for src, worker, spans in trace
+            for name, start, dur in spans
+        ]
+        data = {"traceEvents": events, "displayTimeUnit": "ms", "otherData": self.summary()}
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+# ================= BATCH ================= #
+
+SCAN_REPORT_SECS = 0.2
+
+# Bytes per pixel in Pillow's core; every other mode is stored as 4
+MODE_BYTES = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I;16L": 2, "I;16B": 2}
+# Full-size images alive at once while adjusting (stage input/output, sharpen)
+WORKING_COPIES = 3
+
+def estimate_memory(path, job):
+    """Peak bytes converting path is expected to take, from its header alone.
+
+    Counts the decoded source plus WORKING_COPIES images at the size
+    processing runs at, following the same draft / reduce-on-load steps as
+    open_for_job and fanout_images.
+    """
+    with Image.open(path) as img:
+        bpp = MODE_BYTES.get(img.mode, 4)
+        if job.get('presets'):
+            size = fanout_load_size(img.size, job)
+        else:
+            size = target_size(img, job)
+
+        working = img.width * img.height
+        if job.get('draft', True) and size != img.size:
+            tw, th = size[0] * REDUCING_GAP, size[1] * REDUCING_GAP
+            if img.width >= tw and img.height >= th:
+                if img.format == "JPEG":
+                    # Only adjusts the header-derived size; nothing is decoded
+                    img.draft(img.mode, (tw, th))
+                factor = max(1, min(img.width // tw, img.height // th))
+                working = (img.width // factor) * (img.height // factor)
+        return (img.width * img.height + WORKING_COPIES * working) * bpp
+
+def default_memory_budget():
+    """Half of physical memory, or None (unlimited) where it cannot be read"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+class MemoryBudget:
+    """Admission control on the estimated memory of images being worked on.
+
+    Work is admitted while the total stays within limit bytes (None =
+    unlimited). An item is always admitted when nothing else holds memory,
+    so an image bigger than the whole budget still runs, on its own.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.cond = Condition()
+
+    def _fits(self, n):
+        return self.limit is None or not self.used or self.used + n <= self.limit
+
+    def try_acquire(self, n):
+        with self.cond:
+            if not self._fits(n):
+                return False
+            self.used += n
+            return True
+
+    def acquire(self, n, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self._fits(n), timeout):
+                return False
+            self.used += n
+            return True
+
+    def release(self, n):
+        with self.cond:
+            self.used -= n
+            self.cond.notify_all()
+
+def scan_images(folder, recursive=True, exclude=()):
+    """Yield supported image paths under folder as they are found.
+
+    Directories are read one at a time with os.scandir, so the first files
+    are available straight away even on huge or network-mounted trees and
+    the full listing is never held in memory. Order within a directory is
+    whatever the filesystem returns. Unreadable subfolders and folders in
+    exclude (e.g. an output folder inside the input) are skipped, and
+    symlinked folders are not followed.
+    """
+    exclude = {os.path.abspath(p) for p in exclude}
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(current)
+        except OSError:
+            if current is folder:
+                raise
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and os.path.abspath(entry.path) not in exclude:
+                            stack.append(entry.path)
+                        continue
+                    if not entry.name.lower().endswith(SUPPORTED_EXT) or not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                yield entry.path
+
+def list_images(folder):
+    return sorted(scan_images(folder, recursive=False))
+
+def mirror_dir(path, input_root, output_folder):
+    """Output folder for path, mirroring where it sits under input_root"""
+    rel = os.path.relpath(os.path.dirname(path), input_root)
+    return output_folder if rel == os.curdir else os.path.join(output_folder, rel)
+
+def pool_context():
+    """Start method for batch worker processes.
+
+    Workers are never forked straight from the caller: its other threads
+    (run_batch's scanner opening headers, GUI preview / prefetch /
+    thumbnail threads) may hold a lock, e.g. a Pillow plugin import, and a
+    child forked at that moment deadlocks. forkserver forks them from a
+    clean single-threaded server; spawn where that is unavailable.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def _init_worker():
+    """Per-process setup for batch workers"""
+    # Cancellation is driven by the parent; a Ctrl-C in the terminal must
+    # not kill workers halfway through writing a file
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Register all Pillow plugins once instead of on the first open()
+    Image.init()
+
+def _batch_task(path, output_folder, job, want_digest, cache):
+    """Worker entry point: convert one file, hashing its bytes first if needed.
+
+    Returns (out_paths, digest, stage spans, worker pid, source bytes).
+    """
+    timer = StageTimer()
+    digest = None
+    if want_digest or cache is not None:
+        with timer.stage("hash"):
+            digest = file_digest(path)
+    out_paths = convert_file(path, output_folder, job, cache, digest, timer)
+    return out_paths, digest, timer.spans, os.getpid(), os.path.getsize(path)
+
+def run_batch(files, output_folder, job, workers=None, max_in_flight=None,
+              on_progress=None, cancel=None, manifest=None, cache=None,
+              input_root=None, on_scan=None, memory_budget=None, stats=None):
+    """Convert files on a process pool with a bounded number of jobs in flight.
+
+    files can be any iterable, e.g. a scan_images() generator. It is consumed
+    on its own thread so discovery runs ahead of conversion and files start
+    converting as soon as they are found. With input_root set, each file is
+    written under the matching subfolder of output_folder.
+
+    on_progress(done, total, path, error) is called in the calling thread, in
+    discovery order; total is the number of files found so far that need
+    converting. on_scan(discovered, skipped, complete) is called from the
+    scanning thread every SCAN_REPORT_SECS and once when discovery ends.
+    Setting the cancel Event stops discovery and new submissions, drops
+    queued work and waits for running files to finish. With a
+    gk_cache.Manifest, up-to-date sources are skipped as they are found and
+    converted ones are recorded; cache is a gk_cache.ResultCache, trimmed
+    once the batch ends.
+
+    Files are only submitted while their estimated decoded size (see
+    estimate_memory) fits in memory_budget bytes alongside the files already
+    in flight; None uses default_memory_budget(). Per-stage timings of
+    converted files are added to stats (a BatchStats) when given. Returns
+    (failures, cancelled) where failures is a list of (path, error).
+    """
+    workers = workers or os.cpu_count()
+    max_in_flight = max_in_flight or workers * 2
+    cancel = cancel or Event()
+    budget = MemoryBudget(memory_budget or default_memory_budget())
+    os.makedirs(output_folder, exist_ok=True)
+
+    found = Queue()
+    scan = {"discovered": 0, "skipped": 0, "queued": 0, "complete": False, "error": None}
+
+    def discover():
+        made = {output_folder}
+        last_report = time.monotonic()
+        try:
+            for path in files:
+                if cancel.is_set():
+                    break
+                scan["discovered"] += 1
+                out_dir = mirror_dir(path, input_root, output_folder) if input_root else output_folder
+                try:
+                    current = manifest is not None and manifest.is_current(
+                        path, output_paths(path, out_dir, job), job)
+                except OSError:
+                    # Vanished or unreadable: let the worker report it
+                    current = False
+                if current:
+                    scan["skipped"] += 1
+                else:
+                    if out_dir not in made:
+                        os.makedirs(out_dir, exist_ok=True)
+                        made.add(out_dir)
+                    try:
+                        cost = estimate_memory(path, job) if budget.limit else 0
+                    except Exception:
+                        # Unreadable header: the worker reports the real error
+                        cost = 0
+                    scan["queued"] += 1
+                    found.put((path, out_dir, cost))
+                if on_scan and time.monotonic() - last_report > SCAN_REPORT_SECS:
+                    last_report = time.monotonic()
+                    on_scan(scan["discovered"], scan["skipped"], False)
+            else:
+                scan["complete"] = True
+        except Exception as e:
+            scan["error"] = e
+        finally:
+            found.put(None)
+            if on_scan:
+                on_scan(scan["discovered"], scan["skipped"], True)
+
+    scanner = Thread(target=discover, daemon=True)
+    scanner.start()
+
+    failures = []
+    in_flight = {}
+    finished = {}
+    paths = {}
+    costs = {}
+    held = None
+    submitted = 0
+    next_report = 0
+    scanning = True
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=pool_context(),
+                             initializer=_init_worker) as pool:
+        while True:
+            while (scanning or held) and not cancel.is_set() and len(in_flight) < max_in_flight:
+                if held is None:
+                    try:
+                        # Only block on discovery when there is nothing to wait for
+                        held = found.get(timeout=0.2) if not in_flight else found.get_nowait()
+                    except Empty:
+                        break
+                    if held is None:
+                        scanning = False
+                        break
+                path, out_dir, cost = held
+                if not budget.try_acquire(cost):
+                    # Over budget: hold the file until something finishes
+                    break
+                held = None
+                paths[submitted] = path
+                costs[submitted] = cost
+                in_flight[pool.submit(_batch_task, path, out_dir, job, manifest is not None, cache)] = submitted
+                submitted += 1
+
+            if not in_flight:
+                if scanning and not cancel.is_set():
+                    continue
+                break
+
+            if cancel.is_set():
+                for fut in list(in_flight):
+                    if fut.cancel():
+                        budget.release(costs.pop(in_flight.pop(fut)))
+                if not in_flight:
+                    break
+
+            done, _ = wait(in_flight, timeout=0.05 if scanning else 0.2, return_when=FIRST_COMPLETED)
+            for fut in done:
+                i = in_flight.pop(fut)
+                budget.release(costs.pop(i))
+                error = None
+                try:
+                    out_paths, digest, spans, worker, nbytes = fut.result()
+                    if stats is not None:
+                        stats.add(paths[i], spans, worker, nbytes)
+                    if manifest is not None:
+                        manifest.record(paths[i], out_paths, job, digest)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    failures.append((paths[i], error))
+                finished[i] = error
+
+            # Report in discovery order; out-of-order completions wait here,
+            # bounded by max_in_flight
+            while next_report in finished:
+                error = finished.pop(next_report)
+                path = paths.pop(next_report)
+                next_report += 1
+                if on_progress:
+                    on_progress(next_report, scan["queued"], path, error)
+
+    scanner.join()
+    if manifest is not None:
+        manifest.save()
+    if cache is not None:
+        cache.trim()
+    if scan["error"] is not None:
+        raise scan["error"]
+    return failures, cancel.is_set() and not (scan["complete"] and next_report == scan["queued"])
+
+def batch_convert(input_folder, output_folder, job, workers=None, on_progress=None,
+                  cancel=None, recursive=True):
+    """Convert every supported image under input_folder, mirroring subfolders; see run_batch"""
+    files = scan_images(input_folder, recursive, exclude=[output_folder])
+    return run_batch(files, output_folder, job, workers, on_progress=on_progress,
+                     cancel=cancel, input_root=input_folder)
+
+# ================= PIPELINE ================= #
+
+def run_pipeline(items, decode, process, encode, workers=(2, None, 2),
+                 max_in_flight=None, on_progress=None, cancel=None,
+                 cost=None, memory_budget=None, stats=None):
+    """Run items through decode -> process -> encode thread stages.
+
+    decode(item) -> img, process(img) -> img, encode(item, img). Each stage has
+    its own thread count (workers; None = all cores). At most max_in_flight
+    items are between the start of decode and the end of encode, which bounds
+    the number of decoded images held in memory. With cost(item) -> bytes
+    (e.g. estimate_memory), items also wait for their estimate to fit in
+    memory_budget (None = default_memory_budget()) before decoding. A
+    failure in any stage skips that item and is reported as
+    "<stage>: <error>". Stage times of finished items go to stats (a
+    BatchStats) when given.
+
+    on_progress(done, total, item, error) is called from worker threads; GUI
+    callers must marshal it to their UI thread. Blocks until finished and
+    returns (failures, cancelled).
+    """
+    items = list(items)
+    total = len(items)
+    n_decode, n_process, n_encode = (n or os.cpu_count() for n in workers)
+    max_in_flight = max_in_flight or (n_decode + n_process + n_encode)
+    cancel = cancel or Event()
+
+    slots = Semaphore(max_in_flight)
+    budget = MemoryBudget((memory_budget or default_memory_budget()) if cost else None)
+    lock = Lock()
+    failures = []
+    done = [0]
+    queues = [Queue(), Queue(), Queue()]
+
+    def finish(item, mem, spans, error=None):
+        slots.release()
+        budget.release(mem)
+        if stats is not None and error is None and not cancel.is_set():
+            stats.add(item, spans, get_ident())
+        if cancel.is_set() and error is None:
+            return
+        with lock:
+            done[0] += 1
+            n = done[0]
+            if error:
+                failures.append((item, error))
+        if on_progress:
+            on_progress(n, total, item, error)
+
+    def stage(name, fn, inq, outq):
+        while True:
+            entry = inq.get()
+            if entry is None:
+                break
+            item, value, mem, spans = entry
+            if cancel.is_set():
+                finish(item, mem, spans)
+                continue
+            try:
+                start, t0 = time.time(), time.perf_counter()
+                value = fn(item, value)
+                spans.append((name, start, time.perf_counter() - t0))
+            except Exception as e:
+                finish(item, mem, spans, f"{name}: {type(e).__name__}: {e}")
+                continue
+            if outq is None:
+                finish(item, mem, spans)
+            else:
+                outq.put((item, value, mem, spans))
+
+    stages = [
+        ("decode", lambda item, _: decode(item), queues[0], queues[1], n_decode),
+        ("process", lambda _, img: process(img), queues[1], queues[2], n_process),
+        ("encode", encode, queues[2], None, n_encode)
+    ]
+    threads = [
+        [Thread(target=stage, args=(name, fn, inq, outq), daemon=True) for _ in range(n)]
+        for name, fn, inq, outq, n in stages
+    ]
+    for group in threads:
+        for t in group:
+            t.start()
+
+    # Feed with backpressure: wait for a free slot (and room in the memory
+    # budget) before each decode
+    for item in items:
+        while not slots.acquire(timeout=0.2):
+            if cancel.is_set():
+                break
+        if cancel.is_set():
+            break
+        mem = 0
+        if budget.limit:
+            try:
+                mem = cost(item)
+            except Exception:
+                mem = 0
+        while not budget.acquire(mem, timeout=0.2):
+            if cancel.is_set():
+                break
+        if cancel.is_set():
+            slots.release()
+            break
+        queues[0].put((item, None, mem, []))
+
+    # Shut the stages down in order once their upstream has drained
+    for group, q in zip(threads, queues):
+        for _ in group:
+            q.put(None)
+        for t in group:
+            t.join()
+
+    return failures, cancel.is_set() and done[0] < total
+
+# ================= CLI ================= #
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="GK Image Tool - headless batch converter")
+    p.add_argument("input", help="input folder")
+    p.add_argument("output", help="output folder")
+    p.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                   help="worker processes (default: all cores)")
+    p.add_argument("--in-flight", type=int,
+                   help="max files queued on the pool at once (default: 2x workers)")
+    p.add_argument("--memory-mb", type=int,
+                   help="memory budget for images in flight (default: half of RAM)")
+    p.add_argument("--no-recursive", dest="recursive", action="store_false",
+                   help="only convert images directly inside the input folder")
+    p.add_argument("-c", "--config", help="config.json to read the job spec from")
+    p.add_argument("-f", "--format", choices=FORMATS, type=str.upper)
+    p.add_argument("-e", "--encoder", choices=list(ENCODER_PROFILES),
+                   help="encoder profile (default: balanced)")
+    p.add_argument("--max-kb", type=int,
+                   help="largest JPG/WEBP output in KB; quality is lowered to fit")
+    p.add_argument("--prefix")
+    p.add_argument("--width", type=int)
+    p.add_argument("--height", type=int)
+    p.add_argument("--preset", choices=list(PRESETS.keys()))
+    p.add_argument("--fanout", dest="presets", action="append", choices=list(PRESETS.keys()),
+                   metavar="PRESET",
+                   help="also write this preset size from the same decode (repeatable); each file "
+                        "is exactly its preset size, cropped to fill it (stretched with --no-keep-ratio)")
+    p.add_argument("--all-presets", action="store_true",
+                   help="fan out to every preset size, cropped to fill as with --fanout")
+    p.add_argument("--no-keep-ratio", dest="keep_ratio", action="store_false", default=None)
+    p.add_argument("--no-draft", dest="draft", action="store_false", default=None,
+                   help="always decode at full resolution before resizing")
+    for name in ("brightness", "contrast", "saturation", "sharpness"):
+        p.add_argument(f"--{name}", type=float)
+    p.add_argument("-i", "--incremental", action="store_true",
+                   help="skip sources whose output is up to date (manifest in the output folder)")
+    p.add_argument("--cache", nargs="?", const=CACHE_DIR, metavar="DIR",
+                   help=f"reuse encoded results across runs (default dir: {CACHE_DIR})")
+    p.add_argument("--cache-max-mb", type=int, default=CACHE_MAX_MB)
+    p.add_argument("--cache-link", action="store_true",
+                   help="hard-link cached results into the output instead of copying")
+    p.add_argument("--stats", action="store_true",
+                   help="print per-stage timings (p50/p95/max) when done")
+    p.add_argument("--trace", metavar="FILE",
+                   help="write per-file stage timings as Chrome trace JSON")
+    p.add_argument("-q", "--quiet", action="store_true")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    cfg = {}
+    if args.config:
+        with open(args.config, "r") as f:
+            cfg = json.load(f)
+
+    if args.preset:
+        args.width, args.height = PRESETS[args.preset]
+    if args.all_presets:
+        args.presets = list(PRESETS.keys())
+
+    job = make_job(cfg, **{
+        k: getattr(args, k) for k in DEFAULT_JOB if hasattr(args, k)
+    })
+
+    scan = {"complete": False}
+
+    def on_scan(discovered, skipped, complete):
+        scan["complete"] = complete
+        if complete and args.incremental:
+            print(f"Found {discovered} images, skipping {skipped} up-to-date.")
+
+    def report(done, total, path, error):
+        if error:
+            print(f"Error processing {path}: {error}", file=sys.stderr)
+        elif not args.quiet:
+            more = "" if scan["complete"] else "+"
+            print(f"[{done}/{total}{more}] {os.path.relpath(path, args.input)}")
+
+    cancel = Event()
+    signal.signal(signal.SIGINT, lambda *_: cancel.set())
+
+    try:
+        files = scan_images(args.input, args.recursive, exclude=[args.output])
+        manifest = None
+        if args.incremental:
+            os.makedirs(args.output, exist_ok=True)
+            manifest = Manifest(args.output)
+        cache = None
+        if args.cache:
+            cache = ResultCache(args.cache, args.cache_max_mb, args.cache_link)
+        stats = BatchStats()
+        failures, cancelled = run_batch(
+            files, args.output, job, args.workers,
+            args.in_flight, report, cancel, manifest, cache,
+            input_root=args.input, on_scan=on_scan,
+            memory_budget=args.memory_mb and args.memory_mb * 1024 * 1024,
+            stats=stats
+        )
+        if args.stats:
+            print(stats.format_summary())
+        if args.trace:
+            stats.save_trace(args.trace)
+    except Exception:
+        traceback.print_exc()
+        return 2
+
+    if cancelled:
+        print(f"Batch cancelled. {len(failures)} failed.")
+        return 130
+    print(f"Batch complete! {len(failures)} failed.")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
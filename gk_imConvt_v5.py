@@ -1,17 +1,28 @@
 import customtkinter as ctk
-from tkinter import filedialog, Canvas, colorchooser
-from PIL import Image, ImageTk, ImageEnhance
+from tkinter import filedialog, colorchooser
+from PIL import Image
 import os, json
-from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from gk_viewer import ImageViewer
+from gk_engine import (
+    apply_adjustments, apply_overlay, OverlayCache, get_resize_size, reduce_for_target, save_image,
+    run_pipeline, estimate_memory
+)
 
 # ================= CONFIG ================= #
 
 CONFIG_FILE = "config.json"
 DEFAULT_CONFIG = {
     "format": "PNG",
+    "encoder": "balanced",
     "keep_ratio": True,
     "prefix": "gk",
-    "overlay_text": "gk"
+    "overlay_text": "gk",
+    "decode_workers": 2,
+    "process_workers": 0,
+    "encode_workers": 2,
+    "max_in_flight": 6,
+    "memory_budget_mb": 0
 }
 
 def load_config():
@@ -40,98 +51,40 @@ single_path = None
 input_folder = None
 output_folder = None
 overlay_img = None
-
-# ================= IMAGE VIEW ================= #
-
-class ImageViewer(Canvas):
-    def __init__(self, parent):
-        super().__init__(parent, bg="#1e1e1e", highlightthickness=0)
-        self.pack(fill="both", expand=True)
-        self.img = None
-        self.tk_img = None
-        self.scale = 1.0
-        self.offset = [0, 0]
-
-        self.bind("<MouseWheel>", self.zoom)
-        self.bind("<ButtonPress-1>", self.start_pan)
-        self.bind("<B1-Motion>", self.pan)
-
-    def load(self, img):
-        self.img = img
-        self.scale = 1.0
-        self.offset = [0, 0]
-        self.render()
-
-    def render(self):
-        if not self.img:
-            return
-        w, h = self.img.size
-        resized = self.img.resize(
-            (int(w * self.scale), int(h * self.scale)),
-            Image.LANCZOS
-        )
-        self.tk_img = ImageTk.PhotoImage(resized)
-        self.delete("all")
-        self.create_image(
-            self.offset[0], self.offset[1],
-            anchor="nw", image=self.tk_img
-        )
-
-    def zoom(self, e):
-        self.scale *= 1.1 if e.delta > 0 else 0.9
-        self.render()
-
-    def start_pan(self, e):
-        self.last = (e.x, e.y)
-
-    def pan(self, e):
-        dx = e.x - self.last[0]
-        dy = e.y - self.last[1]
-        self.offset[0] += dx
-        self.offset[1] += dy
-        self.last = (e.x, e.y)
-        self.render()
+# Logo scaled per output size, so a batch of same-sized images scales it once
+overlay_cache = OverlayCache()
 
 # ================= IMAGE PROCESS ================= #
-
-def apply_adjustments(img):
-    img = ImageEnhance.Brightness(img).enhance(brightness.get())
-    img = ImageEnhance.Contrast(img).enhance(contrast.get())
-    img = ImageEnhance.Color(img).enhance(saturation.get())
-    img = ImageEnhance.Sharpness(img).enhance(sharpness.get())
-    return img
-
-def resize_image(img):
-    w = width_entry.get()
-    h = height_entry.get()
-    if not w or not h:
+# Processing works on a settings snapshot taken on the Tk thread, so it is
+# safe to run from the batch pipeline threads
+
+def get_settings():
+    return {
+        "width": width_entry.get(),
+        "height": height_entry.get(),
+        "keep_ratio": keep_ratio.get(),
+        "brightness": brightness.get(),
+        "contrast": contrast.get(),
+        "saturation": saturation.get(),
+        "sharpness": sharpness.get(),
+        "overlay": overlay_img,
+        "overlay_pos": overlay_pos.get(),
+        "format": format_var.get()
+    }
+
+def resize_image(img, s):
+    size = get_resize_size(img.size, s["width"], s["height"], s["keep_ratio"])
+    if size == img.size:
         return img
-    w, h = int(w), int(h)
-    if keep_ratio.get():
-        ratio = img.width / img.height
-        h = int(w / ratio)
-    return img.resize((w, h), Image.LANCZOS)
-
-def apply_overlay(img):
-    if overlay_img:
-        logo = overlay_img.copy()
-        scale = img.width // 6
-        logo.thumbnail((scale, scale))
-        pos = overlay_pos.get()
-        positions = {
-            "Top-Left": (10, 10),
-            "Top-Right": (img.width - logo.width - 10, 10),
-            "Bottom-Left": (10, img.height - logo.height - 10),
-            "Bottom-Right": (img.width - logo.width - 10, img.height - logo.height - 10)
-        }
-        img.paste(logo, positions[pos], logo if logo.mode == "RGBA" else None)
-    return img
-
-def process_image(img):
-    img = resize_image(img)
-    img = apply_adjustments(img)
-    img = apply_overlay(img)
-    return img
+    return img.resize(size, Image.LANCZOS)
+
+def process_image(img, s):
+    out = resize_image(img, s)
+    out = apply_adjustments(out, s["brightness"], s["contrast"], s["saturation"], s["sharpness"])
+    # Never paste the overlay into the caller's image
+    if out is img:
+        out = out.copy()
+    return apply_overlay(out, s["overlay"], s["overlay_pos"], overlay_cache)
 
 # ================= SINGLE ================= #
 
@@ -146,7 +99,7 @@ def select_image():
 def save_single():
     if not single_img:
         return
-    out = process_image(single_img)
+    out = process_image(single_img, get_settings())
     fmt = format_var.get()
     ext = fmt.lower()
     base = os.path.splitext(os.path.basename(single_path))[0]
@@ -167,12 +120,13 @@ def select_output_folder():
     global output_folder
     output_folder = filedialog.askdirectory()
 
-def batch_worker(file_path, out_dir, idx, total):
-    img = Image.open(file_path).convert("RGBA")
-    out = process_image(img)
-    name = os.path.splitext(os.path.basename(file_path))[0]
-    out.save(os.path.join(out_dir, f"{config['prefix']}_{name}.{format_var.get().lower()}"))
-    progress.set((idx + 1) / total)
+def decode_image(file_path, s):
+    with Image.open(file_path) as img:
+        # Downscaling jobs decode JPEGs at reduced scale / box-reduce early
+        size = get_resize_size(img.size, s["width"], s["height"], s["keep_ratio"])
+        if size != img.size:
+            img = reduce_for_target(img, size)
+        return img.convert("RGBA")
 
 def start_batch():
     if not input_folder or not output_folder:
@@ -182,11 +136,58 @@ def start_batch():
         for f in os.listdir(input_folder)
         if f.lower().endswith(SUPPORTED_EXT)
     ]
-    total = len(files)
+    if not files:
+        status_label.configure(text="No supported images found")
+        return
+
+    settings = get_settings()
+    out_dir = output_folder
+    fmt = settings["format"]
+
+    def encode_image(file_path, img):
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        save_image(img, os.path.join(out_dir, f"{config['prefix']}_{name}.{fmt.lower()}"), fmt,
+                   config.get("encoder", "balanced"))
+
+    # Called from pipeline threads; only touch widgets via app.after
+    def on_progress(done, total, file_path, error):
+        if error:
+            print(f"Error processing {file_path}: {error}")
+        app.after(0, lambda: (
+            progress.set(done / total),
+            status_label.configure(text=f"{done}/{total} - {os.path.basename(file_path)}")
+        ))
+
+    def finish(failures):
+        batch_button.configure(state="normal")
+        if failures:
+            names = ", ".join(os.path.basename(f) for f, _ in failures[:3])
+            status_label.configure(text=f"Done, {len(failures)} failed: {names}")
+        else:
+            status_label.configure(text=f"Done: {len(files)} images")
+
+    def run():
+        failures, _ = run_pipeline(
+            files,
+            lambda f: decode_image(f, settings),
+            lambda img: process_image(img, settings),
+            encode_image,
+            workers=(
+                config.get("decode_workers", 2),
+                config.get("process_workers", 0),
+                config.get("encode_workers", 2)
+            ),
+            max_in_flight=config.get("max_in_flight", 6),
+            on_progress=on_progress,
+            cost=lambda f: estimate_memory(f, settings),
+            # 0 = half of RAM
+            memory_budget=config.get("memory_budget_mb", 0) * 1024 * 1024
+        )
+        app.after(0, lambda: finish(failures))
+
     progress.set(0)
-    with ThreadPoolExecutor(max_workers=4) as exe:
-        for i, f in enumerate(files):
-            exe.submit(batch_worker, f, output_folder, i, total)
+    batch_button.configure(state="disabled")
+    Thread(target=run, daemon=True).start()
 
 # ================= UI ================= #
 
@@ -245,10 +246,14 @@ ctk.CTkButton(left, text="Save Single", command=save_single).pack(pady=4)
 ctk.CTkLabel(left, text="Batch").pack(pady=6)
 ctk.CTkButton(left, text="Select Input Folder", command=select_input_folder).pack(pady=2)
 ctk.CTkButton(left, text="Select Output Folder", command=select_output_folder).pack(pady=2)
-ctk.CTkButton(left, text="Start Batch (Fast)", command=start_batch).pack(pady=4)
+batch_button = ctk.CTkButton(left, text="Start Batch (Fast)", command=start_batch)
+batch_button.pack(pady=4)
 
 progress = ctk.CTkProgressBar(left)
 progress.pack(fill="x", padx=10, pady=6)
 progress.set(0)
 
+status_label = ctk.CTkLabel(left, text="", wraplength=380)
+status_label.pack(pady=2)
+
 app.mainloop()
@@ -1,8 +1,10 @@
 import customtkinter as ctk
 from tkinter import filedialog, Canvas, colorchooser
-from PIL import Image, ImageTk, ImageEnhance, ImageDraw, ImageFont
+from PIL import Image, ImageTk, ImageDraw, ImageFont
 import os
+from functools import lru_cache
 from concurrent.futures import ThreadPoolExecutor
+from gk_engine import AdjustmentPipeline
 
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("blue")
@@ -16,8 +18,7 @@ app.minsize(1000, 600)
 
 original_img = None        # untouched
 preview_img = None         # live preview base
-display_img = None         # final shown
-tk_img = None
+adjusted_img = None        # original_img through the sliders; overlays go on top
 
 overlay_logo = None
 logo_pos = [50, 50]
@@ -26,75 +27,246 @@ text_overlay = "gk"
 text_pos = [100, 100]
 text_color = (255, 255, 255)
 font_size = 32
+font_face = "arial.ttf"
 
 crop_rect = None
 crop_start = None
 
+# Caches each enhancement stage, so moving one slider only redoes that
+# stage and the ones after it
+adjust_pipeline = AdjustmentPipeline()
+
+logo_cache = (None, None, None)   # (logo, size, scaled logo)
+
 # ================= VIEWER ================= #
+# The composed image is shown 1:1 as TILE x TILE canvas items, made only
+# for the part in view. A new image or adjustment rebuilds the visible
+# tiles; moving or restyling an overlay re-composes just the tiles under
+# its old and new bounding boxes and pastes them into their PhotoImages.
+
+TILE = 256
 
 class ImageViewer(Canvas):
     def __init__(self, parent):
         super().__init__(parent, bg="#1e1e1e", highlightthickness=0)
         self.pack(fill="both", expand=True)
+        self.size = (0, 0)
+        self.tiles = {}       # (tx, ty) -> (canvas item, PhotoImage)
+        self.crop_item = None
+        self.moving = None    # (overlay kind, last x, last y) while dragging one
+        self.dirty = None     # region waiting for the idle re-blit
+        self.blit_job = None
 
         self.bind("<ButtonPress-1>", self.start_drag)
         self.bind("<B1-Motion>", self.drag)
         self.bind("<ButtonRelease-1>", self.release)
-
-    def show(self, img):
-        global tk_img
-        self.delete("all")
-        self.img = img
-        tk_img = ImageTk.PhotoImage(img)
-        self.create_image(0, 0, anchor="nw", image=tk_img)
-
-        if crop_rect:
-            self.create_rectangle(*crop_rect, outline="red", width=2)
+        self.bind("<Configure>", lambda e: self.update_tiles())
+
+    def show(self, size):
+        """Compose every visible tile of a size image again"""
+        self.size = size
+        self.delete("tile")
+        self.tiles.clear()
+        self.update_tiles()
+
+    def tile_box(self, tx, ty):
+        x0, y0 = tx * TILE, ty * TILE
+        return x0, y0, min(x0 + TILE, self.size[0]), min(y0 + TILE, self.size[1])
+
+    def visible_tiles(self):
+        w = min(self.size[0], max(1, self.winfo_width()))
+        h = min(self.size[1], max(1, self.winfo_height()))
+        return {
+            (tx, ty)
+            for tx in range((w + TILE - 1) // TILE)
+            for ty in range((h + TILE - 1) // TILE)
+        }
+
+    def update_tiles(self):
+        """Create tiles that came into view and drop the rest"""
+        wanted = self.visible_tiles()
+        for key in list(self.tiles):
+            if key not in wanted:
+                self.delete(self.tiles.pop(key)[0])
+        for tx, ty in wanted - set(self.tiles):
+            box = self.tile_box(tx, ty)
+            photo = ImageTk.PhotoImage(compose(box))
+            item = self.create_image(box[0], box[1], anchor="nw", image=photo, tags="tile")
+            self.tiles[(tx, ty)] = (item, photo)
+        if self.crop_item:
+            self.tag_raise(self.crop_item)
+
+    def refresh(self, region):
+        """Re-compose the shown tiles overlapping region (x0, y0, x1, y1)"""
+        if region is None:
+            return
+        x0, y0, x1, y1 = region
+        for (tx, ty), (_, photo) in self.tiles.items():
+            box = self.tile_box(tx, ty)
+            if box[0] < x1 and x0 < box[2] and box[1] < y1 and y0 < box[3]:
+                photo.paste(compose(box))
+
+    def schedule_refresh(self, region):
+        # A burst of drag events is re-blitted once, over the union of their regions
+        self.dirty = union_box(self.dirty, region)
+        if self.blit_job is None:
+            self.blit_job = self.after_idle(self.flush)
+
+    def flush(self):
+        self.blit_job = None
+        region, self.dirty = self.dirty, None
+        self.refresh(region)
+
+    def clear_crop(self):
+        if self.crop_item:
+            self.delete(self.crop_item)
+            self.crop_item = None
 
     def start_drag(self, e):
         global crop_start
-        crop_start = (e.x, e.y)
+        # Pressing on an overlay moves it; anywhere else starts a crop
+        kind = overlay_at(e.x, e.y)
+        if kind:
+            self.moving = (kind, e.x, e.y)
+        else:
+            crop_start = (e.x, e.y)
 
     def drag(self, e):
         global crop_rect
+        if self.moving:
+            kind, x, y = self.moving
+            self.moving = (kind, e.x, e.y)
+            move_overlay(kind, e.x - x, e.y - y)
+            return
+
         crop_rect = (crop_start[0], crop_start[1], e.x, e.y)
-        self.show(display_img)
+        if self.crop_item:
+            self.coords(self.crop_item, *crop_rect)
+        else:
+            self.crop_item = self.create_rectangle(*crop_rect, outline="red", width=2)
 
     def release(self, e):
-        pass
+        self.moving = None
 
 viewer = ImageViewer(app)
 
 # ================= IMAGE PROCESS ================= #
 
+@lru_cache(maxsize=32)
+def get_font(face, size):
+    """Font loaded from disk once per (face, size)"""
+    try:
+        return ImageFont.truetype(face, size)
+    except OSError:
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=64)
+def text_layer(text, face, size):
+    """Coverage mask of text, just big enough for it.
+
+    Returns (mask, offset): offset is where the mask's corner sits relative
+    to the text position. Pasting a color through it gives exactly what
+    ImageDraw.text draws, so the color is not part of the key.
+    """
+    font = get_font(face, size)
+    left, top, right, bottom = font.getbbox(text)
+    mask = Image.new("L", (max(1, right - left), max(1, bottom - top)), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=font)
+    return mask, (left, top)
+
+def scaled_logo(logo, size):
+    """logo thumbnailed to size, kept for the last (logo, size) asked for"""
+    global logo_cache
+    if logo_cache[0] is not logo or logo_cache[1] != size:
+        scaled = logo.copy()
+        scaled.thumbnail(size)
+        logo_cache = (logo, size, scaled)
+    return logo_cache[2]
+
+# ---------- layers ---------- #
+# Adjusted base, then the logo, then the text. Overlay layers are
+# (image or mask, position) in image coordinates.
+
+def logo_layer():
+    if not overlay_logo or not original_img:
+        return None
+    size = (original_img.width // 6, original_img.height // 6)
+    return scaled_logo(overlay_logo, size), tuple(logo_pos)
+
+def text_layer_at():
+    if not text_overlay:
+        return None
+    mask, (dx, dy) = text_layer(text_overlay, font_face, font_size)
+    return mask, (text_pos[0] + dx, text_pos[1] + dy)
+
+def layer_box(kind):
+    """Bounding box of the "logo" or "text" layer as placed now, or None"""
+    layer = logo_layer() if kind == "logo" else text_layer_at()
+    if layer is None:
+        return None
+    img, (x, y) = layer
+    return x, y, x + img.width, y + img.height
+
+def union_box(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+def overlay_at(x, y):
+    """The overlay under point (x, y), topmost first"""
+    if not adjusted_img:
+        return None
+    for kind in ("text", "logo"):
+        box = layer_box(kind)
+        if box and box[0] <= x < box[2] and box[1] <= y < box[3]:
+            return kind
+    return None
+
+def compose(box):
+    """The final image over box (x0, y0, x1, y1), layers pasted clipped to it"""
+    x0, y0 = box[:2]
+    img = adjusted_img.crop(box)
+
+    logo = logo_layer()
+    if logo:
+        logo, (x, y) = logo
+        img.paste(logo, (x - x0, y - y0), logo)
+
+    text = text_layer_at()
+    if text:
+        mask, (x, y) = text
+        x, y = x - x0, y - y0
+        img.paste(text_color, (x, y, x + mask.width, y + mask.height), mask)
+    return img
+
 def apply_live_preview(*_):
-    global display_img
+    """Full refresh, for a new image or adjustment"""
+    global adjusted_img
     if not original_img:
         return
 
-    img = original_img.copy()
-
-    img = ImageEnhance.Brightness(img).enhance(brightness.get())
-    img = ImageEnhance.Contrast(img).enhance(contrast.get())
-    img = ImageEnhance.Color(img).enhance(saturation.get())
-    img = ImageEnhance.Sharpness(img).enhance(sharpness.get())
-
-    draw = ImageDraw.Draw(img)
-
-    if overlay_logo:
-        logo = overlay_logo.copy()
-        logo.thumbnail((img.width // 6, img.height // 6))
-        img.paste(logo, logo_pos, logo)
+    adjusted_img = adjust_pipeline.render(
+        original_img,
+        brightness.get(),
+        contrast.get(),
+        saturation.get(),
+        sharpness.get()
+    )
+    viewer.show(adjusted_img.size)
 
-    if text_overlay:
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except:
-            font = ImageFont.load_default()
-        draw.text(text_pos, text_overlay, fill=text_color, font=font)
+def overlay_changed(kind, old_box):
+    """Re-blit where kind's layer was (old_box) and where it is now"""
+    if adjusted_img:
+        viewer.schedule_refresh(union_box(old_box, layer_box(kind)))
 
-    display_img = img
-    viewer.show(display_img)
+def move_overlay(kind, dx, dy):
+    old_box = layer_box(kind)
+    pos = text_pos if kind == "text" else logo_pos
+    pos[0] += dx
+    pos[1] += dy
+    overlay_changed(kind, old_box)
 
 # ================= LOAD IMAGE ================= #
 
@@ -113,8 +285,9 @@ def select_logo():
     global overlay_logo
     p = filedialog.askopenfilename(filetypes=[("PNG", "*.png")])
     if p:
+        old_box = layer_box("logo")
         overlay_logo = Image.open(p).convert("RGBA")
-        apply_live_preview()
+        overlay_changed("logo", old_box)
 
 # ================= TEXT ================= #
 
@@ -123,7 +296,7 @@ def choose_text_color():
     c = colorchooser.askcolor()[0]
     if c:
         text_color = tuple(map(int, c))
-        apply_live_preview()
+        overlay_changed("text", layer_box("text"))
 
 # ================= CROP ================= #
 
@@ -133,19 +306,20 @@ def apply_crop():
         x1, y1, x2, y2 = crop_rect
         original_img = original_img.crop((x1, y1, x2, y2))
         crop_rect = None
+        viewer.clear_crop()
         apply_live_preview()
 
 # ================= SAVE ================= #
 
 def save_image():
-    if not display_img:
+    if not adjusted_img:
         return
     path = filedialog.asksaveasfilename(
         defaultextension=".png",
         filetypes=[("PNG", "*.png"), ("JPG", "*.jpg"), ("WEBP", "*.webp")]
     )
     if path:
-        display_img.convert("RGB").save(path)
+        compose((0, 0) + adjusted_img.size).convert("RGB").save(path)
 
 # ================= UI ================= #
 
@@ -178,20 +352,21 @@ text_entry.pack(pady=4)
 
 def update_text():
     global text_overlay
+    old_box = layer_box("text")
     text_overlay = text_entry.get()
-    apply_live_preview()
+    overlay_changed("text", old_box)
+
+def set_font_size(v):
+    global font_size
+    old_box = layer_box("text")
+    font_size = int(float(v))
+    overlay_changed("text", old_box)
 
 ctk.CTkButton(controls, text="Update Text", command=update_text).pack(pady=2)
 ctk.CTkButton(controls, text="Text Color", command=choose_text_color).pack(pady=2)
 
 ctk.CTkLabel(controls, text="Font Size").pack()
-ctk.CTkSlider(
-    controls, from_=10, to=100,
-    command=lambda v: (
-        globals().__setitem__("font_size", int(float(v))),
-        apply_live_preview()
-    )
-).pack(fill="x", padx=10)
+ctk.CTkSlider(controls, from_=10, to=100, command=set_font_size).pack(fill="x", padx=10)
 
 ctk.CTkButton(controls, text="Apply Crop", command=apply_crop).pack(pady=6)
 ctk.CTkButton(controls, text="Save Image", command=save_image).pack(pady=10)
@@ -1,11 +1,19 @@
 import customtkinter as ctk
-from tkinter import filedialog, Canvas
-from PIL import Image, ImageTk, ImageEnhance, ImageFilter
+import tkinter
+from tkinter import filedialog
+from PIL import Image, ImageFilter
 import os
 import json
-from threading import Thread
-from queue import Queue
+from threading import Thread, Event
 import traceback
+from gk_viewer import ImageViewer
+from gk_thumbs import ThumbnailGrid
+from gk_cache import Manifest, ResultCache, ThumbnailCache, file_digest
+from gk_engine import (
+    SUPPORTED_EXT, PRESETS, FORMATS, ENCODER_PROFILES, MODE_BYTES, AdjustmentPipeline, PreviewRenderer,
+    Prefetcher, make_job, process_image, write_image, output_name, scan_images, list_images, run_batch,
+    fit_size, BatchStats
+)
 
 # ================= CONFIG ================= #
 #Code From Claude 
@@ -14,12 +22,19 @@ import traceback
 CONFIG_FILE = "config.json"
 DEFAULT_CONFIG = {
     "format": "PNG",
+    "encoder": "balanced",
+    "max_kb": None,
     "keep_ratio": True,
     "prefix": "gk_",
     "brightness": 1.0,
     "contrast": 1.0,
     "saturation": 1.0,
-    "sharpness": 1.0
+    "sharpness": 1.0,
+    "incremental": False,
+    "result_cache": False,
+    "recursive": True,
+    "memory_budget_mb": 0,
+    "show_perf_panel": False
 }
 
 def load_config():
@@ -42,71 +57,18 @@ def save_config(cfg):
 
 config = load_config()
 
-SUPPORTED_EXT = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tiff")
-
-PRESETS = {
-    "Instagram Post (1:1)": (1080, 1080),
-    "Instagram Story / Reel (9:16)": (1080, 1920),
-    "YouTube Thumbnail (16:9)": (1280, 720),
-    "Facebook Post (1200x630)": (1200, 630),
-    "Twitter Post (1200x675)": (1200, 675)
-}
-
-# ================= APP ================= #
-
-ctk.set_appearance_mode("Dark")
-ctk.set_default_color_theme("blue")
-
-app = ctk.CTk()
-app.title("GK Image Tool Pro - Enhanced")
-app.geometry("1200x700")
-app.resizable(True, True)
-
 # Global variables
 single_img = None
 single_path = None
 input_folder = None
 output_folder = None
-preview_queue = Queue()
-is_processing = False
+preview_pipeline = AdjustmentPipeline()
+draft_pipeline = AdjustmentPipeline()
+batch_cancel = None
+batch_stats = None
 
 # ================= IMAGE PROCESSING ================= #
 
-def apply_adjustments(img, brightness=1.0, contrast=1.0, saturation=1.0, sharpness=1.0):
-    """Apply color corrections to image safely"""
-    try:
-        if img is None or img.size[0] == 0 or img.size[1] == 0:
-            return img
-        
-        # Convert to RGB if needed
-        if img.mode not in ('RGB', 'RGBA'):
-            img = img.convert('RGB')
-        
-        # Apply brightness
-        if brightness != 1.0:
-            enhancer = ImageEnhance.Brightness(img)
-            img = enhancer.enhance(brightness)
-        
-        # Apply contrast
-        if contrast != 1.0:
-            enhancer = ImageEnhance.Contrast(img)
-            img = enhancer.enhance(contrast)
-        
-        # Apply saturation
-        if saturation != 1.0:
-            enhancer = ImageEnhance.Color(img)
-            img = enhancer.enhance(saturation)
-        
-        # Apply sharpness
-        if sharpness != 1.0:
-            enhancer = ImageEnhance.Sharpness(img)
-            img = enhancer.enhance(sharpness)
-        
-        return img
-    except Exception as e:
-        print(f"Error applying adjustments: {e}")
-        return img
-
 def get_current_adjustments():
     """Get current slider values safely"""
     try:
@@ -124,232 +86,226 @@ def get_current_adjustments():
             'sharpness': 1.0
         }
 
-# ================= IMAGE VIEWER (ZOOM + PAN) ================= #
-
-class ImageViewer(Canvas):
-    def __init__(self, parent):
-        super().__init__(parent, bg="#1e1e1e", highlightthickness=0)
-        self.pack(fill="both", expand=True)
-        self.img = None
-        self.tk_img = None
-        self.scale = 1.0
-        self.offset = [0, 0]
-        self.dragging = False
-
-        self.bind("<MouseWheel>", self.zoom)
-        self.bind("<ButtonPress-1>", self.start_pan)
-        self.bind("<B1-Motion>", self.pan)
-        self.bind("<ButtonRelease-1>", self.end_pan)
-        
-        # For trackpad/Linux
-        self.bind("<Button-4>", lambda e: self.zoom_in())
-        self.bind("<Button-5>", lambda e: self.zoom_out())
-
-    def load(self, img):
-        """Load image safely"""
-        try:
-            if img is None:
-                return
-            self.img = img.copy()
-            self.scale = 1.0
-            self.offset = [0, 0]
-            self.render()
-        except Exception as e:
-            print(f"Error loading image: {e}")
-
-    def render(self):
-        """Render image with current scale and offset"""
-        try:
-            if not self.img or self.img.size[0] == 0:
-                return
-            
-            w, h = self.img.size
-            new_w = max(1, int(w * self.scale))
-            new_h = max(1, int(h * self.scale))
-            
-            # Use LANCZOS for downscaling, BILINEAR for upscaling (faster)
-            resampling = Image.LANCZOS if self.scale < 1.0 else Image.BILINEAR
-            resized = self.img.resize((new_w, new_h), resampling)
-            
-            self.tk_img = ImageTk.PhotoImage(resized)
-            self.delete("all")
-            self.create_image(
-                self.offset[0], self.offset[1],
-                anchor="nw", image=self.tk_img
-            )
-        except Exception as e:
-            print(f"Error rendering: {e}")
-
-    def zoom(self, e):
-        try:
-            if e.delta > 0:
-                self.zoom_in()
-            else:
-                self.zoom_out()
-        except:
-            pass
-
-    def zoom_in(self):
-        self.scale = min(self.scale * 1.1, 10.0)
-        self.render()
-
-    def zoom_out(self):
-        self.scale = max(self.scale * 0.9, 0.1)
-        self.render()
-
-    def start_pan(self, e):
-        self.last = (e.x, e.y)
-        self.dragging = True
-
-    def pan(self, e):
-        if self.dragging:
-            dx = e.x - self.last[0]
-            dy = e.y - self.last[1]
-            self.offset[0] += dx
-            self.offset[1] += dy
-            self.last = (e.x, e.y)
-            self.render()
-
-    def end_pan(self, e):
-        self.dragging = False
+def get_current_job():
+    """Snapshot the UI settings into an engine job spec (call on the Tk thread)"""
+    return make_job(
+        config,
+        format=format_var.get(),
+        encoder=encoder_var.get(),
+        # 0, not None: a blank entry must override a saved config value
+        max_kb=max_kb_entry.get().strip() or 0,
+        keep_ratio=keep_ratio.get(),
+        width=width_entry.get().strip() or None,
+        height=height_entry.get().strip() or None,
+        presets=[name for name, var in fanout_vars.items() if var.get()],
+        **get_current_adjustments()
+    )
 
 # ================= HELPERS ================= #
 
-def get_resize_size(img):
-    """Get target resize dimensions safely"""
-    try:
-        w = width_entry.get().strip()
-        h = height_entry.get().strip()
-
-        if not w or not h:
-            return img.size
-
-        w, h = int(w), int(h)
-
-        if keep_ratio.get() and w > 0:
-            ratio = img.width / img.height
-            h = max(1, int(w / ratio))
-
-        return max(1, w), max(1, h)
-    except:
-        return img.size
-
-def update_preview():
-    """Update preview with current adjustments - debounced"""
-    if not single_img or is_processing:
-        return
-    
-    # Add to queue
-    preview_queue.put(True)
-    
-    # Process after short delay
-    app.after(100, process_preview_queue)
-
-def process_preview_queue():
-    """Process preview updates from queue"""
-    global is_processing
-    
-    if preview_queue.empty() or is_processing:
+# Preview renders run on a PreviewRenderer worker thread, never on the Tk
+# event loop. Each slider change supersedes any render in flight.
+#
+# Two tiers: while a slider is moving, a small proxy resized with a cheap
+# filter is rendered; once input has been idle for PREVIEW_IDLE_MS the
+# screen-size preview is refined with LANCZOS. Both tiers are shown at the
+# refined preview's size so the view does not jump.
+
+PREVIEW_MAX = 1920
+PROXY_MAX = 480
+PREVIEW_IDLE_MS = 250
+
+preview_bases = (None, None, None)   # (source image, preview, proxy)
+refine_job = None
+
+def make_preview_bases(src):
+    """(preview, proxy) thumbnails of src: PREVIEW_MAX and PROXY_MAX bound"""
+    size = fit_size(src.size, PREVIEW_MAX)
+    preview = src if size == src.size else src.resize(size, Image.LANCZOS)
+    proxy = preview.resize(fit_size(size, PROXY_MAX), Image.BILINEAR)
+    return preview, proxy
+
+def get_preview_bases(src):
+    """(preview, proxy) thumbnails of src, built once per image"""
+    global preview_bases
+    if preview_bases[0] is not src:
+        preview_bases = (src, *make_preview_bases(src))
+    return preview_bases[1:]
+
+def render_preview(src, adj, draft, stale):
+    """Runs on the preview worker thread"""
+    preview, proxy = get_preview_bases(src)
+    if stale():
+        return None
+    if draft:
+        return draft_pipeline.render(proxy, stale=stale, **adj)
+    return preview_pipeline.render(preview, stale=stale, **adj)
+
+def show_preview(generation, img):
+    """Runs on the Tk thread; drops frames superseded while queued"""
+    if preview_renderer.is_current(generation) and single_img:
+        viewer.load(img, size=fit_size(single_img.size, PREVIEW_MAX), reset_view=False)
+
+def update_preview(draft=False):
+    """Request a preview render with the current adjustments"""
+    global refine_job
+    if not single_img:
         return
-    
-    # Clear queue
-    while not preview_queue.empty():
-        preview_queue.get()
-    
-    is_processing = True
-    
-    try:
-        if single_img:
-            adj = get_current_adjustments()
-            
-            # Create thumbnail for faster preview
-            max_preview = 1920
-            if single_img.width > max_preview or single_img.height > max_preview:
-                thumb = single_img.copy()
-                thumb.thumbnail((max_preview, max_preview), Image.LANCZOS)
-            else:
-                thumb = single_img
-            
-            processed = apply_adjustments(
-                thumb,
-                adj['brightness'],
-                adj['contrast'],
-                adj['saturation'],
-                adj['sharpness']
-            )
-            
-            viewer.load(processed)
-    except Exception as e:
-        print(f"Preview error: {e}")
-    finally:
-        is_processing = False
+    if refine_job:
+        app.after_cancel(refine_job)
+        refine_job = None
+    if draft:
+        refine_job = app.after(PREVIEW_IDLE_MS, update_preview)
+    preview_renderer.request(single_img, get_current_adjustments(), draft)
 
 # ================= SINGLE IMAGE ================= #
 
 def select_image():
-    global single_img, single_path
+    p = filedialog.askopenfilename(
+        filetypes=[("Images", " ".join(f"*{ext}" for ext in SUPPORTED_EXT))]
+    )
+    if p:
+        load_image(p)
+
+def load_image(p):
+    """Make p the single image: show it once decoded and prefetch its neighbours"""
+    global nav_target
+    p = os.path.normpath(p)
+    nav_target = p
+    files = folder_images(p)
+    order = [p]
+    if p in files:
+        i = files.index(p)
+        for k in range(1, max(PREFETCH_NEXT, PREFETCH_PREV) + 1):
+            if k <= PREFETCH_NEXT and i + k < len(files):
+                order.append(files[i + k])
+            if k <= PREFETCH_PREV and i - k >= 0:
+                order.append(files[i - k])
+    prefetcher.prefetch(order)
+
+    entry = prefetcher.get(p)
+    if entry:
+        show_image(p, entry)
+    else:
+        status_label.configure(text=f"Loading {os.path.basename(p)}...")
+
+def show_image(p, entry):
+    """Make a decoded (image, preview, proxy) entry the single image: reset sliders and show it"""
+    global single_img, single_path, preview_bases
     try:
-        p = filedialog.askopenfilename(
-            filetypes=[("Images", " ".join(f"*{ext}" for ext in SUPPORTED_EXT))]
-        )
-        if p:
-            single_path = p
-            single_img = Image.open(p)
-            
-            # Reset sliders
-            reset_adjustments()
-            
-            viewer.load(single_img)
-            status_label.configure(text=f"Loaded: {os.path.basename(p)} ({single_img.width}x{single_img.height})")
+        single_img, preview, proxy = entry
+        single_path = p
+        preview_bases = entry
+        
+        # Reset sliders
+        reset_adjustments()
+        
+        viewer.load(preview, size=fit_size(single_img.size, PREVIEW_MAX))
+        status_label.configure(text=f"Loaded: {os.path.basename(p)} ({single_img.width}x{single_img.height})")
     except Exception as e:
         status_label.configure(text=f"Error loading image: {str(e)}")
 
+# ================= NAVIGATION ================= #
+# Next / previous step through the current image's folder. A prefetcher
+# decodes the next PREFETCH_NEXT and previous PREFETCH_PREV images, with
+# their preview tiers, into a bounded cache while the current one is
+# viewed, so stepping shows an already decoded image.
+
+PREFETCH_NEXT = 2
+PREFETCH_PREV = 1
+PREFETCH_MAX_MB = 1024
+
+nav_folder = (None, [])   # (folder, its images sorted)
+nav_target = None
+
+def decode_for_view(p):
+    """Runs on a prefetch thread: (full image, preview, proxy)"""
+    img = Image.open(p)
+    # Decode here so the preview thread never races a lazy load
+    img.load()
+    return (img, *make_preview_bases(img))
+
+def entry_bytes(entry):
+    img, preview, proxy = entry
+    # The preview is the source itself for images under PREVIEW_MAX
+    images = [img, proxy] if preview is img else [img, preview, proxy]
+    return sum(im.width * im.height * MODE_BYTES.get(im.mode, 4) for im in images)
+
+def folder_images(p):
+    """Sorted images next to p; listed once per folder"""
+    global nav_folder
+    folder = os.path.dirname(p)
+    if nav_folder[0] != folder:
+        nav_folder = (folder, list_images(folder))
+    return nav_folder[1]
+
+def on_prefetched(p, entry):
+    """Runs on the Tk thread; shows the image being waited for"""
+    if p != nav_target or p == single_path:
+        return
+    if entry is None:
+        status_label.configure(text=f"Error loading image: {os.path.basename(p)}")
+    else:
+        show_image(p, entry)
+
+def step_image(delta):
+    """Show the image delta places away in the current folder"""
+    current = nav_target or single_path
+    if not current:
+        return
+    files = folder_images(current)
+    if current not in files:
+        return
+    i = files.index(current) + delta
+    if 0 <= i < len(files):
+        load_image(files[i])
+        if files[i] in thumb_grid.index:
+            thumb_grid.select(files[i])
+
+def on_arrow(delta):
+    # Arrow keys in a text field move the cursor, not the image
+    if not isinstance(app.focus_get(), (tkinter.Entry, tkinter.Text)):
+        step_image(delta)
+
 def save_single():
     if not single_img:
         status_label.configure(text="No image loaded!")
         return
     
     try:
-        # Get adjustments
-        adj = get_current_adjustments()
-        
-        # Apply adjustments
-        processed = apply_adjustments(
-            single_img,
-            adj['brightness'],
-            adj['contrast'],
-            adj['saturation'],
-            adj['sharpness']
-        )
-        
-        # Resize
-        size = get_resize_size(processed)
-        if size != processed.size:
-            processed = processed.resize(size, Image.LANCZOS)
-
-        # Get format and extension
-        fmt = format_var.get()
-        ext = fmt.lower()
-        if ext == "jpg":
-            ext = "jpeg"
-        
-        base = os.path.splitext(os.path.basename(single_path))[0]
+        job = get_current_job()
+        # Single save writes one file, and single_img is already decoded at
+        # full size; key the cache on exactly that
+        job['presets'] = []
+        job['draft'] = False
+
+        fmt = job['format']
+        ext = os.path.splitext(output_name(single_path, job))[1]
 
         path = filedialog.asksaveasfilename(
-            initialfile=f"{config['prefix']}{base}.{ext}",
-            defaultextension=f".{ext}",
-            filetypes=[(fmt, f"*.{ext}")]
+            initialfile=output_name(single_path, job),
+            defaultextension=ext,
+            filetypes=[(fmt, f"*{ext}")]
         )
         
         if path:
-            # Save with proper format handling
-            if fmt == "JPG":
-                processed = processed.convert('RGB')
-                processed.save(path, "JPEG", quality=95)
-            else:
-                processed.save(path, fmt)
+            cache = ResultCache() if result_cache_var.get() else None
+            if cache:
+                key = cache.key(file_digest(single_path), job)
+                if cache.fetch(key, [path]):
+                    status_label.configure(text=f"Saved (cached): {os.path.basename(path)}")
+                    return
+            
+            processed = process_image(single_img, job)
+            quality = write_image(processed, path, fmt, job['encoder'], job['max_kb'])
+            if cache:
+                cache.store(key, [path])
+                cache.trim()
             
-            status_label.configure(text=f"Saved: {os.path.basename(path)}")
+            info = ""
+            if quality is not None:
+                info = f" ({os.path.getsize(path) // 1024} KB at quality {quality})"
+            status_label.configure(text=f"Saved: {os.path.basename(path)}{info}")
     except Exception as e:
         status_label.configure(text=f"Error saving: {str(e)}")
         traceback.print_exc()
@@ -362,6 +318,43 @@ def select_input_folder():
     if folder:
         input_folder = folder
         status_label.configure(text=f"Input: {folder}")
+        browse_folder(folder)
+
+# ================= BROWSER ================= #
+
+BROWSE_CHUNK = 256
+
+def browse_folder(folder):
+    """Fill the thumbnail grid from a background scan of folder"""
+    thumb_grid.clear()
+    right_tabs.set("Browse")
+    generation = thumb_grid.generation
+    exclude = [output_folder] if output_folder else []
+    files = scan_images(folder, recursive_var.get(), exclude=exclude)
+
+    def add(chunk):
+        # A newer folder may have been opened meanwhile
+        if thumb_grid.generation == generation:
+            thumb_grid.add_paths(chunk)
+
+    def scan():
+        try:
+            chunk = []
+            for path in files:
+                chunk.append(path)
+                if len(chunk) >= BROWSE_CHUNK:
+                    app.after(0, add, chunk)
+                    chunk = []
+            app.after(0, add, chunk)
+            thumb_cache.trim()
+        except Exception as e:
+            print(f"Error scanning {folder}: {e}")
+
+    Thread(target=scan, daemon=True).start()
+
+def open_from_grid(path):
+    load_image(path)
+    right_tabs.set("Viewer")
 
 def select_output_folder():
     global output_folder
@@ -371,76 +364,158 @@ def select_output_folder():
         status_label.configure(text=f"Output: {folder}")
 
 def batch_convert():
+    global batch_cancel, batch_stats
     if not input_folder or not output_folder:
         status_label.configure(text="Select input and output folders!")
         return
     
+    try:
+        job = get_current_job()
+    except ValueError as e:
+        status_label.configure(text=str(e))
+        return
+    files = scan_images(input_folder, recursive_var.get(), exclude=[output_folder])
+    incremental = incremental_var.get()
+    cache = ResultCache() if result_cache_var.get() else None
+    batch_cancel = Event()
+    batch_stats = BatchStats()
+    stats = batch_stats
+    cancel = batch_cancel
+    
+    # Files are converted while the folder is still being scanned; counts
+    # are shared with the UI thread, which only reads them
+    counts = {"discovered": 0, "skipped": 0, "done": 0, "total": 0, "scanning": True, "name": ""}
+    
+    progress.set(0)
+    batch_button.configure(state="disabled")
+    cancel_button.configure(state="normal")
+    
+    def show_counts():
+        found = f"{counts['discovered']} found" + ("..." if counts["scanning"] else "")
+        if counts["skipped"]:
+            found += f", {counts['skipped']} unchanged"
+        if counts["total"]:
+            progress.set(counts["done"] / counts["total"])
+        status_label.configure(text=f"Processing: {counts['done']}/{counts['total']} ({found}) {counts['name']}")
+    
+    # Tk is not thread-safe: worker threads only hand updates to the UI
+    # thread through app.after
+    def on_scan(discovered, skipped, complete):
+        counts.update(discovered=discovered, skipped=skipped, scanning=not complete)
+        app.after(0, show_counts)
+    
+    def on_progress(done, total, path, error):
+        if error:
+            print(f"Error processing {path}: {error}")
+        counts.update(done=done, total=total, name=os.path.basename(path))
+        app.after(0, show_counts)
+    
+    def finish(failures, cancelled):
+        refresh_perf(force=True)
+        batch_button.configure(state="normal")
+        cancel_button.configure(state="disabled")
+        if cancelled:
+            status_label.configure(text=f"Batch cancelled. {len(failures)} failed.")
+        elif not counts["discovered"]:
+            status_label.configure(text="No supported images found!")
+        else:
+            status_label.configure(text=f"Batch complete! Processed {counts['done']} images, skipped {counts['skipped']} unchanged, {len(failures)} failed.")
+    
     def process():
         try:
-            files = [f for f in os.listdir(input_folder) if f.lower().endswith(SUPPORTED_EXT)]
-            
-            if not files:
-                status_label.configure(text="No supported images found!")
-                return
-            
-            fmt = format_var.get()
-            ext = fmt.lower()
-            if ext == "jpg":
-                ext = "jpeg"
-            
-            adj = get_current_adjustments()
-            
-            progress.set(0)
-            batch_button.configure(state="disabled")
-            
-            for i, f in enumerate(files):
-                try:
-                    img_path = os.path.join(input_folder, f)
-                    img = Image.open(img_path)
-                    
-                    # Apply adjustments
-                    processed = apply_adjustments(
-                        img,
-                        adj['brightness'],
-                        adj['contrast'],
-                        adj['saturation'],
-                        adj['sharpness']
-                    )
-                    
-                    # Resize
-                    size = get_resize_size(processed)
-                    if size != processed.size:
-                        processed = processed.resize(size, Image.LANCZOS)
-                    
-                    # Save
-                    name = os.path.splitext(f)[0]
-                    out_path = os.path.join(output_folder, f"{config['prefix']}{name}.{ext}")
-                    
-                    if fmt == "JPG":
-                        processed = processed.convert('RGB')
-                        processed.save(out_path, "JPEG", quality=95)
-                    else:
-                        processed.save(out_path, fmt)
-                    
-                    progress.set((i + 1) / len(files))
-                    status_label.configure(text=f"Processing: {i+1}/{len(files)} - {f}")
-                    app.update_idletasks()
-                    
-                except Exception as e:
-                    print(f"Error processing {f}: {e}")
-                    continue
-            
-            status_label.configure(text=f"Batch complete! Processed {len(files)} images.")
-            batch_button.configure(state="normal")
-            
+            manifest = Manifest(output_folder) if incremental else None
+            failures, cancelled = run_batch(files, output_folder, job, on_progress=on_progress,
+                                            cancel=cancel, manifest=manifest, cache=cache, stats=stats,
+                                            input_root=input_folder, on_scan=on_scan,
+                                            memory_budget=config.get("memory_budget_mb", 0) * 1024 * 1024)
+            app.after(0, lambda: finish(failures, cancelled))
         except Exception as e:
-            status_label.configure(text=f"Batch error: {str(e)}")
-            batch_button.configure(state="normal")
             traceback.print_exc()
+            # e is unbound once the except block ends, before the callback runs
+            msg = f"Batch error: {e}"
+            app.after(0, lambda: (
+                status_label.configure(text=msg),
+                batch_button.configure(state="normal"),
+                cancel_button.configure(state="disabled")
+            ))
     
-    # Run in thread to prevent UI freeze
+    # Scanning and pool coordination run off the Tk thread to prevent UI freeze
     Thread(target=process, daemon=True).start()
 
+def cancel_batch():
+    if batch_cancel:
+        batch_cancel.set()
+        cancel_button.configure(state="disabled")
+        status_label.configure(text="Cancelling - finishing files in progress...")
+
+# ================= PERFORMANCE PANEL ================= #
+
+PERF_REFRESH_MS = 500
+perf_seen = None
+perf_job = None
+
+def toggle_perf_panel():
+    global perf_job
+    if perf_job:
+        app.after_cancel(perf_job)
+        perf_job = None
+    if perf_var.get():
+        perf_frame.pack(pady=4, padx=10, fill="x", after=perf_toggle)
+        refresh_perf(force=True)
+        perf_job = app.after(PERF_REFRESH_MS, perf_tick)
+    else:
+        perf_frame.pack_forget()
+
+def perf_tick():
+    global perf_job
+    refresh_perf()
+    perf_job = app.after(PERF_REFRESH_MS, perf_tick)
+
+def format_perf(stats):
+    """Compact summary for the panel: throughput, bottleneck, per-stage times"""
+    s = stats.summary()
+    if not s["files"]:
+        return "Waiting for the first image..."
+    total = sum(st["total"] for st in s["stages"].values()) or 1
+    slowest = s["slowest"]
+    lines = [
+        f"{s['images_per_s']:.2f} img/s  {s['mb_per_s']:.1f} MB/s  ({s['files']} images)",
+        f"Slowest: {slowest} ({s['stages'][slowest]['total'] / total:.0%} of time)",
+        "",
+        f"{'stage':<8}{'p50':>8}{'p95':>8}{'max':>8}"
+    ]
+    for name, st in s["stages"].items():
+        lines.append(
+            f"{name:<8}{st['p50'] * 1000:>6.0f}ms{st['p95'] * 1000:>6.0f}ms{st['max'] * 1000:>6.0f}ms"
+        )
+    return "\n".join(lines)
+
+def refresh_perf(force=False):
+    """Redraw the panel while it is shown; only when new files have finished"""
+    global perf_seen
+    if not perf_var.get() or batch_stats is None:
+        return
+    seen = (id(batch_stats), batch_stats.files)
+    if force or seen != perf_seen:
+        perf_seen = seen
+        perf_label.configure(text=format_perf(batch_stats))
+
+def export_trace():
+    if batch_stats is None:
+        status_label.configure(text="Run a batch first!")
+        return
+    path = filedialog.asksaveasfilename(
+        initialfile="gk_trace.json",
+        defaultextension=".json",
+        filetypes=[("Chrome trace", "*.json")]
+    )
+    if path:
+        try:
+            batch_stats.save_trace(path)
+            status_label.configure(text=f"Trace saved: {os.path.basename(path)}")
+        except Exception as e:
+            status_label.configure(text=f"Error saving trace: {str(e)}")
+
 # ================= ADJUSTMENT CONTROLS ================= #
 
 def reset_adjustments():
@@ -453,119 +528,209 @@ def reset_adjustments():
 
 def on_slider_change(value):
     """Called when any slider changes"""
-    update_preview()
+    update_preview(draft=True)
 
 # ================= UI LAYOUT ================= #
+# Guarded so batch worker processes (spawned, which re-import this script)
+# never build a window
 
-# Left panel - Controls
-left = ctk.CTkScrollableFrame(app, width=380)
-left.pack(side="left", fill="y", padx=10, pady=10)
-left.pack_propagate(False)
+if __name__ == "__main__":
+    ctk.set_appearance_mode("Dark")
+    ctk.set_default_color_theme("blue")
 
-# Right panel - Image viewer
-right = ctk.CTkFrame(app)
-right.pack(side="right", fill="both", expand=True, padx=10, pady=10)
+    app = ctk.CTk()
+    app.title("GK Image Tool Pro - Enhanced")
+    app.geometry("1200x700")
+    app.resizable(True, True)
 
-viewer = ImageViewer(right)
+    # Left panel - Controls
+    left = ctk.CTkScrollableFrame(app, width=380)
+    left.pack(side="left", fill="y", padx=10, pady=10)
+    left.pack_propagate(False)
 
-# === SINGLE IMAGE SECTION ===
-ctk.CTkLabel(left, text="📸 Single Image", font=("", 16, "bold")).pack(pady=(10, 5))
+    # Right panel - Image viewer
+    right = ctk.CTkFrame(app)
+    right.pack(side="right", fill="both", expand=True, padx=10, pady=10)
 
-ctk.CTkButton(left, text="Select Image", command=select_image, height=35).pack(pady=6)
+    # Viewer and folder browser share the right panel
+    right_tabs = ctk.CTkTabview(right)
+    right_tabs.pack(fill="both", expand=True)
+    right_tabs.add("Viewer")
+    right_tabs.add("Browse")
 
-# === SIZE CONTROLS ===
-ctk.CTkLabel(left, text="📐 Resize", font=("", 14, "bold")).pack(pady=(15, 5))
+    viewer = ImageViewer(right_tabs.tab("Viewer"))
 
-width_entry = ctk.CTkEntry(left, placeholder_text="Width (blank = original)")
-width_entry.pack(pady=4, padx=10, fill="x")
+    thumb_cache = ThumbnailCache()
+    thumb_grid = ThumbnailGrid(right_tabs.tab("Browse"), on_select=open_from_grid, cache=thumb_cache)
 
-height_entry = ctk.CTkEntry(left, placeholder_text="Height (blank = original)")
-height_entry.pack(pady=4, padx=10, fill="x")
-
-keep_ratio = ctk.BooleanVar(value=config["keep_ratio"])
-ctk.CTkCheckBox(left, text="🔒 Keep Aspect Ratio", variable=keep_ratio).pack(pady=4)
-
-ctk.CTkLabel(left, text="Presets:").pack(pady=(8, 2))
-ctk.CTkOptionMenu(
-    left, values=list(PRESETS.keys()),
-    command=lambda c: (
-        width_entry.delete(0, "end"),
-        height_entry.delete(0, "end"),
-        width_entry.insert(0, PRESETS[c][0]),
-        height_entry.insert(0, PRESETS[c][1])
+    preview_renderer = PreviewRenderer(
+        render_preview,
+        lambda generation, img: app.after(0, show_preview, generation, img)
     )
-).pack(pady=4, padx=10, fill="x")
-
-# === FORMAT ===
-ctk.CTkLabel(left, text="Format:").pack(pady=(8, 2))
-format_var = ctk.StringVar(value=config["format"])
-ctk.CTkOptionMenu(left, values=["PNG", "JPG", "WEBP"], variable=format_var).pack(pady=4, padx=10, fill="x")
-
-# === COLOR ADJUSTMENTS ===
-ctk.CTkLabel(left, text="🎨 Color Adjustments", font=("", 14, "bold")).pack(pady=(15, 5))
 
-# Brightness
-ctk.CTkLabel(left, text="☀️ Brightness").pack(pady=(8, 2))
-brightness_slider = ctk.CTkSlider(left, from_=0.2, to=2.0, number_of_steps=180, command=on_slider_change)
-brightness_slider.set(config.get("brightness", 1.0))
-brightness_slider.pack(pady=4, padx=10, fill="x")
-
-# Contrast
-ctk.CTkLabel(left, text="◐ Contrast").pack(pady=(8, 2))
-contrast_slider = ctk.CTkSlider(left, from_=0.2, to=2.0, number_of_steps=180, command=on_slider_change)
-contrast_slider.set(config.get("contrast", 1.0))
-contrast_slider.pack(pady=4, padx=10, fill="x")
-
-# Saturation
-ctk.CTkLabel(left, text="🌈 Saturation").pack(pady=(8, 2))
-saturation_slider = ctk.CTkSlider(left, from_=0.0, to=2.0, number_of_steps=200, command=on_slider_change)
-saturation_slider.set(config.get("saturation", 1.0))
-saturation_slider.pack(pady=4, padx=10, fill="x")
-
-# Sharpness
-ctk.CTkLabel(left, text="🔍 Sharpness").pack(pady=(8, 2))
-sharpness_slider = ctk.CTkSlider(left, from_=0.0, to=2.0, number_of_steps=200, command=on_slider_change)
-sharpness_slider.set(config.get("sharpness", 1.0))
-sharpness_slider.pack(pady=4, padx=10, fill="x")
+    prefetcher = Prefetcher(
+        decode_for_view,
+        lambda p, entry: app.after(0, on_prefetched, p, entry),
+        max_bytes=PREFETCH_MAX_MB * 1024 * 1024,
+        size_of=entry_bytes
+    )
+    app.bind("<Left>", lambda e: on_arrow(-1))
+    app.bind("<Right>", lambda e: on_arrow(1))
 
-ctk.CTkButton(left, text="Reset Adjustments", command=reset_adjustments, fg_color="gray", height=30).pack(pady=8, padx=10, fill="x")
+    # === SINGLE IMAGE SECTION ===
+    ctk.CTkLabel(left, text="📸 Single Image", font=("", 16, "bold")).pack(pady=(10, 5))
 
-# === SAVE ===
-ctk.CTkButton(left, text="💾 Save Single Image", command=save_single, height=40, fg_color="green").pack(pady=10, padx=10, fill="x")
+    ctk.CTkButton(left, text="Select Image", command=select_image, height=35).pack(pady=6)
 
-# === BATCH SECTION ===
-ctk.CTkLabel(left, text="📦 Batch Processing", font=("", 16, "bold")).pack(pady=(20, 5))
+    nav_row = ctk.CTkFrame(left, fg_color="transparent")
+    nav_row.pack(pady=(0, 6))
+    ctk.CTkButton(nav_row, text="◀ Prev", width=90, command=lambda: step_image(-1)).pack(side="left", padx=4)
+    ctk.CTkButton(nav_row, text="Next ▶", width=90, command=lambda: step_image(1)).pack(side="left", padx=4)
 
-ctk.CTkButton(left, text="Select Input Folder", command=select_input_folder, height=35).pack(pady=4, padx=10, fill="x")
-ctk.CTkButton(left, text="Select Output Folder", command=select_output_folder, height=35).pack(pady=4, padx=10, fill="x")
+    # === SIZE CONTROLS ===
+    ctk.CTkLabel(left, text="📐 Resize", font=("", 14, "bold")).pack(pady=(15, 5))
 
-batch_button = ctk.CTkButton(left, text="▶️ Start Batch Convert", command=batch_convert, height=40, fg_color="orange")
-batch_button.pack(pady=10, padx=10, fill="x")
+    width_entry = ctk.CTkEntry(left, placeholder_text="Width (blank = original)")
+    width_entry.pack(pady=4, padx=10, fill="x")
 
-progress = ctk.CTkProgressBar(left)
-progress.pack(pady=4, padx=10, fill="x")
-progress.set(0)
+    height_entry = ctk.CTkEntry(left, placeholder_text="Height (blank = original)")
+    height_entry.pack(pady=4, padx=10, fill="x")
 
-# === STATUS BAR ===
-status_label = ctk.CTkLabel(left, text="Ready", wraplength=350)
-status_label.pack(pady=10, padx=10)
+    keep_ratio = ctk.BooleanVar(value=config["keep_ratio"])
+    ctk.CTkCheckBox(left, text="🔒 Keep Aspect Ratio", variable=keep_ratio).pack(pady=4)
 
-# === CLEANUP ===
-def on_closing():
-    """Save config on exit"""
-    try:
-        config["brightness"] = brightness_slider.get()
-        config["contrast"] = contrast_slider.get()
-        config["saturation"] = saturation_slider.get()
-        config["sharpness"] = sharpness_slider.get()
-        config["keep_ratio"] = keep_ratio.get()
-        config["format"] = format_var.get()
-        save_config(config)
-    except:
-        pass
-    app.destroy()
+    ctk.CTkLabel(left, text="Presets:").pack(pady=(8, 2))
+    ctk.CTkOptionMenu(
+        left, values=list(PRESETS.keys()),
+        command=lambda c: (
+            width_entry.delete(0, "end"),
+            height_entry.delete(0, "end"),
+            width_entry.insert(0, PRESETS[c][0]),
+            height_entry.insert(0, PRESETS[c][1])
+        )
+    ).pack(pady=4, padx=10, fill="x")
+
+    # Batch fan-out: every checked preset is written from a single decode,
+    # cropped to fill exactly its size
+    ctk.CTkLabel(left, text="Batch: also export sizes").pack(pady=(8, 2))
+    fanout_vars = {}
+    for name in PRESETS:
+        fanout_vars[name] = ctk.BooleanVar(value=name in config.get("presets", []))
+        ctk.CTkCheckBox(left, text=name, variable=fanout_vars[name]).pack(pady=2, padx=20, anchor="w")
+
+    # === FORMAT ===
+    ctk.CTkLabel(left, text="Format:").pack(pady=(8, 2))
+    format_var = ctk.StringVar(value=config["format"])
+    ctk.CTkOptionMenu(left, values=FORMATS, variable=format_var).pack(pady=4, padx=10, fill="x")
+
+    # Speed / file size trade-off of the encoder
+    encoder_var = ctk.StringVar(value=config.get("encoder", "balanced"))
+    ctk.CTkSegmentedButton(left, values=list(ENCODER_PROFILES), variable=encoder_var).pack(pady=4, padx=10, fill="x")
+
+    # Target file size: JPG / WEBP quality is lowered until the output fits
+    max_kb_entry = ctk.CTkEntry(left, placeholder_text="Max size KB (JPG/WEBP, blank = off)")
+    max_kb_entry.pack(pady=4, padx=10, fill="x")
+    if config.get("max_kb"):
+        max_kb_entry.insert(0, str(config["max_kb"]))
+
+    # === COLOR ADJUSTMENTS ===
+    ctk.CTkLabel(left, text="🎨 Color Adjustments", font=("", 14, "bold")).pack(pady=(15, 5))
+
+    # Brightness
+    ctk.CTkLabel(left, text="☀️ Brightness").pack(pady=(8, 2))
+    brightness_slider = ctk.CTkSlider(left, from_=0.2, to=2.0, number_of_steps=180, command=on_slider_change)
+    brightness_slider.set(config.get("brightness", 1.0))
+    brightness_slider.pack(pady=4, padx=10, fill="x")
+
+    # Contrast
+    ctk.CTkLabel(left, text="◐ Contrast").pack(pady=(8, 2))
+    contrast_slider = ctk.CTkSlider(left, from_=0.2, to=2.0, number_of_steps=180, command=on_slider_change)
+    contrast_slider.set(config.get("contrast", 1.0))
+    contrast_slider.pack(pady=4, padx=10, fill="x")
+
+    # Saturation
+    ctk.CTkLabel(left, text="🌈 Saturation").pack(pady=(8, 2))
+    saturation_slider = ctk.CTkSlider(left, from_=0.0, to=2.0, number_of_steps=200, command=on_slider_change)
+    saturation_slider.set(config.get("saturation", 1.0))
+    saturation_slider.pack(pady=4, padx=10, fill="x")
+
+    # Sharpness
+    ctk.CTkLabel(left, text="🔍 Sharpness").pack(pady=(8, 2))
+    sharpness_slider = ctk.CTkSlider(left, from_=0.0, to=2.0, number_of_steps=200, command=on_slider_change)
+    sharpness_slider.set(config.get("sharpness", 1.0))
+    sharpness_slider.pack(pady=4, padx=10, fill="x")
+
+    ctk.CTkButton(left, text="Reset Adjustments", command=reset_adjustments, fg_color="gray", height=30).pack(pady=8, padx=10, fill="x")
+
+    # === SAVE ===
+    ctk.CTkButton(left, text="💾 Save Single Image", command=save_single, height=40, fg_color="green").pack(pady=10, padx=10, fill="x")
+
+    # === BATCH SECTION ===
+    ctk.CTkLabel(left, text="📦 Batch Processing", font=("", 16, "bold")).pack(pady=(20, 5))
+
+    ctk.CTkButton(left, text="Select Input Folder", command=select_input_folder, height=35).pack(pady=4, padx=10, fill="x")
+    ctk.CTkButton(left, text="Select Output Folder", command=select_output_folder, height=35).pack(pady=4, padx=10, fill="x")
+
+    incremental_var = ctk.BooleanVar(value=config.get("incremental", False))
+    ctk.CTkCheckBox(left, text="⏭ Skip unchanged images", variable=incremental_var).pack(pady=4)
+
+    recursive_var = ctk.BooleanVar(value=config.get("recursive", True))
+    ctk.CTkCheckBox(left, text="📂 Include subfolders", variable=recursive_var).pack(pady=4)
+
+    result_cache_var = ctk.BooleanVar(value=config.get("result_cache", False))
+    ctk.CTkCheckBox(left, text="♻ Reuse cached results", variable=result_cache_var).pack(pady=4)
+
+    batch_button = ctk.CTkButton(left, text="▶️ Start Batch Convert", command=batch_convert, height=40, fg_color="orange")
+    batch_button.pack(pady=10, padx=10, fill="x")
+
+    cancel_button = ctk.CTkButton(left, text="⏹ Cancel Batch", command=cancel_batch, height=30, fg_color="gray", state="disabled")
+    cancel_button.pack(pady=4, padx=10, fill="x")
+
+    progress = ctk.CTkProgressBar(left)
+    progress.pack(pady=4, padx=10, fill="x")
+    progress.set(0)
+
+    # === STATUS BAR ===
+    status_label = ctk.CTkLabel(left, text="Ready", wraplength=350)
+    status_label.pack(pady=10, padx=10)
+
+    # === PERFORMANCE PANEL ===
+    perf_var = ctk.BooleanVar(value=config.get("show_perf_panel", False))
+    perf_toggle = ctk.CTkCheckBox(left, text="📊 Performance", variable=perf_var, command=toggle_perf_panel)
+    perf_toggle.pack(pady=4)
+
+    perf_frame = ctk.CTkFrame(left)
+    perf_label = ctk.CTkLabel(perf_frame, text="No batch run yet", font=("Courier", 12), justify="left", anchor="w")
+    perf_label.pack(pady=4, padx=8, fill="x")
+    ctk.CTkButton(perf_frame, text="Export Trace", command=export_trace, height=28).pack(pady=4, padx=8, fill="x")
+    if perf_var.get():
+        toggle_perf_panel()
+
+    # === CLEANUP ===
+    def on_closing():
+        """Save config on exit"""
+        try:
+            config["brightness"] = brightness_slider.get()
+            config["contrast"] = contrast_slider.get()
+            config["saturation"] = saturation_slider.get()
+            config["sharpness"] = sharpness_slider.get()
+            config["keep_ratio"] = keep_ratio.get()
+            config["format"] = format_var.get()
+            config["encoder"] = encoder_var.get()
+            config["max_kb"] = max_kb_entry.get().strip() or None
+            config["incremental"] = incremental_var.get()
+            config["result_cache"] = result_cache_var.get()
+            config["recursive"] = recursive_var.get()
+            config["show_perf_panel"] = perf_var.get()
+            config["presets"] = [name for name, var in fanout_vars.items() if var.get()]
+            save_config(config)
+        except:
+            pass
+        if batch_cancel:
+            batch_cancel.set()
+        app.destroy()
 
-app.protocol("WM_DELETE_WINDOW", on_closing)
+    app.protocol("WM_DELETE_WINDOW", on_closing)
 
-# Start app
-app.mainloop()
+    # Start app
+    app.mainloop()
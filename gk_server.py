@@ -0,0 +1,306 @@
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import traceback
+from threading import Lock
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, UnidentifiedImageError
+from gk_cache import job_digest, normalize_job
+from gk_engine import (
+    PRESETS, FORMATS, DEFAULT_JOB, make_job, output_ext, save_image, convert_to_bytes, pool_context
+)
+
+# ================= CONFIG ================= #
+# Local HTTP conversion service on the shared engine, for callers that
+# would otherwise shell out to the CLI. Conversions run on a process pool
+# that is started and warmed up before the first request; identical
+# requests in flight at the same time share one computation.
+#
+#   python gk_server.py --port 8765
+#
+#   POST /convert?format=JPG&width=1280&height=720   body: image bytes
+#   POST /convert?preset=YouTube Thumbnail (16:9)    body: image bytes
+#   POST /convert   {"path": "/photos/a.tif", "job": {...config.json keys...}}
+#   GET  /health
+#
+# Query parameters are job keys (see DEFAULT_JOB) plus preset=NAME; a JSON
+# body's "job" takes the same keys as config.json, query parameters win.
+# The reply is the encoded image; X-Quality carries the quality picked for
+# max_kb and X-Coalesced: 1 marks a result shared with another request.
+
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_UPLOAD_MB = 256
+CHUNK = 64 * 1024
+
+# ================= WORKERS ================= #
+
+def _warm_worker():
+    """Load the codecs in a fresh worker so the first real request does not pay for it"""
+    Image.init()
+    img = Image.new("RGB", (16, 16))
+    for fmt in FORMATS:
+        save_image(img, io.BytesIO(), fmt)
+    # Stay busy briefly so every warm-up lands on its own process
+    time.sleep(0.2)
+    return os.getpid()
+
+def _convert_task(src, job):
+    """Runs in a worker: src is the uploaded bytes or a local path"""
+    if isinstance(src, bytes):
+        src = io.BytesIO(src)
+    return convert_to_bytes(src, job)
+
+class Coalescer:
+    """Submits work to a pool once per key; identical requests in flight share the future.
+
+    A worker that dies (e.g. killed for memory) breaks the whole pool: its
+    futures fail with BrokenProcessPool and the pool is replaced with a
+    new one from start(), so later requests run again.
+    """
+
+    def __init__(self, pool, start):
+        self.pool = pool
+        self.start = start
+        self.lock = Lock()
+        self.running = {}   # key -> Future
+        self.requests = 0
+        self.coalesced = 0
+
+    def submit(self, key, fn, *args):
+        """Returns (future, shared)"""
+        with self.lock:
+            self.requests += 1
+            fut = self.running.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return fut, True
+            pool = self.pool
+            try:
+                fut = pool.submit(fn, *args)
+            except BrokenProcessPool:
+                pool = self._replace(pool)
+                fut = pool.submit(fn, *args)
+            self.running[key] = fut
+        # Outside the lock: the callback runs right here if fut is already done
+        fut.add_done_callback(lambda f: self._done(key, f, pool))
+        return fut, False
+
+    def _done(self, key, fut, pool):
+        with self.lock:
+            if self.running.get(key) is fut:
+                del self.running[key]
+            if not fut.cancelled() and isinstance(fut.exception(), BrokenProcessPool):
+                self._replace(pool)
+
+    def _replace(self, broken):
+        """New pool in place of broken, unless that was done already; call with the lock held"""
+        if self.pool is broken:
+            print("Worker pool broke, starting a new one", file=sys.stderr)
+            broken.shutdown(wait=False)
+            self.pool = self.start()
+        return self.pool
+
+def start_pool(workers):
+    # Not forked: the HTTP threads may hold locks a forked worker would inherit
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=pool_context())
+    wait([pool.submit(_warm_worker) for _ in range(workers)])
+    return pool
+
+# ================= REQUESTS ================= #
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def parse_value(key, raw):
+    default = DEFAULT_JOB[key]
+    if isinstance(default, bool):
+        return raw.lower() in ("1", "true", "yes", "on")
+    if isinstance(default, float):
+        return float(raw)
+    if key in ("width", "height", "max_kb"):
+        return int(raw) if raw else None
+    return raw
+
+def build_job(cfg, query):
+    """Job spec from a config.json-style dict plus query parameters"""
+    overrides = {}
+    try:
+        for key, values in query.items():
+            if key == "preset":
+                if values[-1] not in PRESETS:
+                    raise RequestError(400, f"Unknown preset: {values[-1]}")
+                overrides["width"], overrides["height"] = PRESETS[values[-1]]
+            elif key in DEFAULT_JOB and key != "presets":
+                overrides[key] = parse_value(key, values[-1])
+        job = make_job(cfg, **overrides)
+    except (TypeError, ValueError) as e:
+        raise RequestError(400, str(e))
+    if job["presets"]:
+        raise RequestError(400, "One output per request: use preset=NAME instead of presets")
+    return job
+
+def source_key(src, job):
+    """Coalescing key: the source (content, or path + size + mtime) and the normalized job"""
+    if isinstance(src, bytes):
+        ident = hashlib.sha256(src).hexdigest()
+    else:
+        st = os.stat(src)
+        ident = f"{src}:{st.st_size}:{st.st_mtime_ns}"
+    return f"{ident}:{job_digest(normalize_job(job))}"
+
+# ================= HTTP ================= #
+
+class ConvertHandler(BaseHTTPRequestHandler):
+    server_version = "gk_server/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/health":
+            return self.send_error_text(404, "Not found")
+        coalescer = self.server.coalescer
+        self.send_json(200, {
+            "workers": self.server.workers,
+            "in_flight": len(coalescer.running),
+            "requests": coalescer.requests,
+            "coalesced": coalescer.coalesced
+        })
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/convert":
+            return self.send_error_text(404, "Not found")
+        try:
+            src, job = self.read_request(parse_qs(url.query))
+            fut, shared = self.server.coalescer.submit(source_key(src, job), _convert_task, src, job)
+            data, quality = fut.result()
+        except RequestError as e:
+            return self.send_error_text(e.status, str(e))
+        except FileNotFoundError as e:
+            return self.send_error_text(404, f"Not found: {e.filename}")
+        except BrokenProcessPool:
+            return self.send_error_text(503, "Worker crashed; the pool was restarted, try again")
+        except UnidentifiedImageError:
+            return self.send_error_text(415, "Cannot decode image")
+        except Exception as e:
+            traceback.print_exc()
+            return self.send_error_text(500, f"{type(e).__name__}: {e}")
+
+        self.send_response(200)
+        self.send_header("Content-Type", f"image/{output_ext(job['format'])}")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Coalesced", "1" if shared else "0")
+        if quality is not None:
+            self.send_header("X-Quality", str(quality))
+        self.end_headers()
+        view = memoryview(data)
+        for i in range(0, len(data), CHUNK):
+            self.wfile.write(view[i:i + CHUNK])
+
+    def read_request(self, query):
+        """(source, job) of a POST: uploaded bytes, or a local path from a JSON body"""
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise RequestError(411, "Content-Length required")
+        try:
+            length = int(length)
+        except ValueError:
+            raise RequestError(400, "Invalid Content-Length")
+        if length > MAX_UPLOAD_MB * 1024 * 1024:
+            raise RequestError(413, f"Upload larger than {MAX_UPLOAD_MB} MB")
+        body = self.rfile.read(length)
+
+        if self.headers.get("Content-Type", "").split(";")[0].strip() != "application/json":
+            if not body:
+                raise RequestError(400, "Empty upload")
+            return body, build_job({}, query)
+
+        try:
+            request = json.loads(body)
+        except ValueError:
+            raise RequestError(400, "Invalid JSON")
+        if not isinstance(request, dict) or not request.get("path") or not isinstance(request["path"], str):
+            raise RequestError(400, "JSON body needs a \"path\"")
+        cfg = request.get("job") or {}
+        if not isinstance(cfg, dict):
+            raise RequestError(400, "\"job\" must be an object")
+        root = self.server.root
+        if root is None:
+            raise RequestError(403, "Local paths are disabled (start with --root)")
+        path = os.path.realpath(request["path"])
+        try:
+            inside = os.path.commonpath([root, path]) == root
+        except ValueError:
+            # Another drive on Windows
+            inside = False
+        if not inside:
+            raise RequestError(403, f"Path outside {root}")
+        return path, build_job(cfg, query)
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_text(self, status, message):
+        # The request body may not have been read: do not reuse the connection
+        self.close_connection = True
+        self.send_json(status, {"error": message})
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+# ================= CLI ================= #
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="GK Image Tool - local HTTP conversion service")
+    p.add_argument("--host", default=HOST, help="address to bind (default: %(default)s)")
+    p.add_argument("-p", "--port", type=int, default=PORT)
+    p.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                   help="worker processes (default: all cores)")
+    p.add_argument("--root", help="allow converting local paths under this folder")
+    p.add_argument("-q", "--quiet", action="store_true", help="do not log every request")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print(f"Starting {args.workers} workers...")
+    pool = start_pool(args.workers)
+    try:
+        server = ThreadingHTTPServer((args.host, args.port), ConvertHandler)
+    except OSError as e:
+        print(f"Cannot listen on {args.host}:{args.port}: {e}", file=sys.stderr)
+        pool.shutdown()
+        return 2
+    server.daemon_threads = True
+    server.workers = args.workers
+    server.coalescer = Coalescer(pool, lambda: start_pool(args.workers))
+    server.root = os.path.realpath(args.root) if args.root else None
+    server.quiet = args.quiet
+
+    print(f"Listening on http://{args.host}:{server.server_port}/convert. Ctrl+C to stop.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.coalescer.pool.shutdown(cancel_futures=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
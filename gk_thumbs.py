@@ -0,0 +1,210 @@
+from tkinter import Canvas, Frame, Scrollbar
+from PIL import ImageTk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+from gk_engine import cached_thumbnail
+
+# ================= THUMBNAIL GRID (FOLDER BROWSER) ================= #
+# A virtual grid: the scroll region covers every file, but canvas items
+# exist only for the rows in view and thumbnails are decoded only for those
+# cells, on a small thread pool (draft-mode decodes release the GIL).
+# Requests for cells scrolled away before their turn are dropped, so
+# flinging through a 10k folder never queues 10k decodes.
+
+THUMB = 128
+PAD = 6
+LABEL_H = 16
+CELL_W = THUMB + 2 * PAD
+CELL_H = THUMB + 2 * PAD + LABEL_H
+MAX_PHOTOS = 600
+THUMB_WORKERS = 4
+BG = "#1e1e1e"
+
+class ThumbnailGrid(Frame):
+    def __init__(self, parent, on_select=None, cache=None, size=THUMB, workers=THUMB_WORKERS):
+        super().__init__(parent, bg=BG)
+        self.pack(fill="both", expand=True)
+        self.canvas = Canvas(self, bg=BG, highlightthickness=0, yscrollincrement=CELL_H // 4)
+        self.bar = Scrollbar(self, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self.on_scroll)
+        self.bar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self.on_select = on_select
+        self.cache = cache
+        self.size = size
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.paths = []
+        self.index = {}              # path -> position in the grid
+        self.cols = 1
+        self.generation = 0
+        self.photos = OrderedDict()  # path -> PhotoImage, LRU
+        self.pending = {}            # path -> Future
+        self.drawn = {}              # position -> (frame, image, label) items
+        self.wanted = set()          # paths in view; read by pool threads
+        self.selected = None
+        self.update_job = None
+
+        self.canvas.bind("<Configure>", lambda e: self.relayout())
+        self.canvas.bind("<ButtonPress-1>", self.click)
+        self.canvas.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        # For trackpad/Linux
+        self.canvas.bind("<Button-4>", lambda e: self.scroll(-1))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll(1))
+        self.bind("<Destroy>", lambda e: self.pool.shutdown(wait=False, cancel_futures=True))
+
+    # ---------- contents ---------- #
+
+    def clear(self):
+        """Forget the current folder; in-flight decodes are discarded"""
+        self.generation += 1
+        for fut in self.pending.values():
+            fut.cancel()
+        self.pending.clear()
+        self.wanted = set()
+        self.paths = []
+        self.index = {}
+        self.drawn.clear()
+        self.selected = None
+        self.canvas.delete("all")
+        self.canvas.yview_moveto(0)
+        self.relayout()
+
+    def add_paths(self, paths):
+        """Append files (e.g. as a folder scan finds them)"""
+        for p in paths:
+            self.index[p] = len(self.paths)
+            self.paths.append(p)
+        self.update_region()
+        self.schedule_update()
+
+    # ---------- layout ---------- #
+
+    def relayout(self):
+        cols = max(1, self.canvas.winfo_width() // CELL_W)
+        if cols != self.cols:
+            self.cols = cols
+            self.canvas.delete("cell")
+            self.drawn.clear()
+        self.update_region()
+        self.schedule_update()
+
+    def update_region(self):
+        rows = (len(self.paths) + self.cols - 1) // self.cols
+        self.canvas.configure(scrollregion=(0, 0, self.cols * CELL_W, max(1, rows * CELL_H)))
+
+    def cell_origin(self, i):
+        return (i % self.cols) * CELL_W, (i // self.cols) * CELL_H
+
+    def visible_range(self):
+        top = self.canvas.canvasy(0)
+        bottom = self.canvas.canvasy(max(1, self.canvas.winfo_height()))
+        first = int(top // CELL_H) * self.cols
+        last = (int(bottom // CELL_H) + 1) * self.cols
+        return range(max(0, first), min(len(self.paths), last))
+
+    def on_scroll(self, lo, hi):
+        self.bar.set(lo, hi)
+        self.schedule_update()
+
+    def scroll(self, direction):
+        self.canvas.yview_scroll(direction * 2, "units")
+
+    def schedule_update(self):
+        # Coalesce bursts of scroll / resize / add events into one pass
+        if self.update_job is None:
+            self.update_job = self.after_idle(self.update_visible)
+
+    def update_visible(self):
+        """Draw cells in view, drop the rest, request missing thumbnails"""
+        self.update_job = None
+        visible = self.visible_range()
+        wanted = set(visible)
+
+        for i in list(self.drawn):
+            if i not in wanted:
+                for item in self.drawn.pop(i):
+                    self.canvas.delete(item)
+
+        self.wanted = {self.paths[i] for i in visible}
+        for path, fut in list(self.pending.items()):
+            if path not in self.wanted and fut.cancel():
+                del self.pending[path]
+
+        for i in visible:
+            if i not in self.drawn:
+                self.draw_cell(i)
+
+    def draw_cell(self, i):
+        path = self.paths[i]
+        x, y = self.cell_origin(i)
+        outline = "#1f6aa5" if path == self.selected else "#333333"
+        frame = self.canvas.create_rectangle(
+            x + 2, y + 2, x + CELL_W - 2, y + CELL_H - 2, outline=outline, width=2, tags="cell"
+        )
+        image = self.canvas.create_image(x + CELL_W // 2, y + PAD + THUMB // 2, tags="cell")
+        label = self.canvas.create_text(
+            x + CELL_W // 2, y + CELL_H - PAD - LABEL_H // 2,
+            text=self.short_name(path), fill="#cccccc", font=("", 8), tags="cell"
+        )
+        self.drawn[i] = (frame, image, label)
+
+        photo = self.photos.get(path)
+        if photo is not None:
+            self.photos.move_to_end(path)
+            self.canvas.itemconfigure(image, image=photo)
+        elif path not in self.pending:
+            self.pending[path] = self.pool.submit(self.load, path, self.generation)
+
+    @staticmethod
+    def short_name(path, limit=20):
+        name = os.path.basename(path)
+        return name if len(name) <= limit else name[:limit - 3] + "..."
+
+    # ---------- thumbnails ---------- #
+
+    def load(self, path, generation):
+        """Runs on a pool thread; skips cells scrolled away since the request"""
+        thumb = None
+        if generation == self.generation and path in self.wanted:
+            try:
+                thumb = cached_thumbnail(path, self.size, self.cache)
+            except Exception as e:
+                print(f"Error loading thumbnail {path}: {e}")
+        # Tk is not thread-safe: hand the result (or the skip) to the Tk thread
+        self.after(0, self.show, path, generation, thumb)
+
+    def show(self, path, generation, thumb):
+        if generation != self.generation:
+            return
+        self.pending.pop(path, None)
+        if thumb is None:
+            return
+        photo = ImageTk.PhotoImage(thumb)
+        self.photos[path] = photo
+        while len(self.photos) > MAX_PHOTOS:
+            self.photos.popitem(last=False)
+        cell = self.drawn.get(self.index.get(path))
+        if cell:
+            self.canvas.itemconfigure(cell[1], image=photo)
+
+    # ---------- selection ---------- #
+
+    def click(self, e):
+        x, y = self.canvas.canvasx(e.x), self.canvas.canvasy(e.y)
+        col, row = int(x // CELL_W), int(y // CELL_H)
+        i = row * self.cols + col
+        if col >= self.cols or i >= len(self.paths):
+            return
+        self.select(self.paths[i])
+        if self.on_select:
+            self.on_select(self.paths[i])
+
+    def select(self, path):
+        """Highlight path's cell"""
+        for p in (self.selected, path):
+            cell = self.drawn.get(self.index.get(p))
+            if cell:
+                self.canvas.itemconfigure(cell[0], outline="#1f6aa5" if p == path else "#333333")
+        self.selected = path
@@ -0,0 +1,180 @@
+from tkinter import Canvas
+from PIL import Image, ImageTk
+from collections import OrderedDict
+import math
+
+# ================= TILED IMAGE VIEWER (ZOOM + PAN) ================= #
+# The image is drawn as a grid of TILE x TILE canvas items at the current
+# zoom. Only tiles intersecting the canvas are rendered, each from the
+# smallest pyramid level that still has enough detail; panning just moves
+# the existing items and fills in newly exposed tiles.
+
+TILE = 256
+MAX_TILES = 512
+
+class ImageViewer(Canvas):
+    def __init__(self, parent, max_tiles=MAX_TILES):
+        super().__init__(parent, bg="#1e1e1e", highlightthickness=0)
+        self.pack(fill="both", expand=True)
+        self.img = None
+        self.size = (0, 0)
+        self.levels = []
+        self.scale = 1.0
+        self.offset = [0, 0]
+        self.dragging = False
+        self.generation = 0
+        self.max_tiles = max_tiles
+        self.cache = OrderedDict()   # (generation, scale, tx, ty) -> PhotoImage, LRU
+        self.shown = {}              # (tx, ty) -> (canvas item, PhotoImage)
+
+        self.bind("<MouseWheel>", self.zoom)
+        self.bind("<ButtonPress-1>", self.start_pan)
+        self.bind("<B1-Motion>", self.pan)
+        self.bind("<ButtonRelease-1>", self.end_pan)
+        self.bind("<Configure>", lambda e: self.update_tiles())
+
+        # For trackpad/Linux
+        self.bind("<Button-4>", lambda e: self.zoom_in())
+        self.bind("<Button-5>", lambda e: self.zoom_out())
+
+    def load(self, img, size=None, reset_view=True):
+        """Load image safely.
+
+        size is the logical size img stands for (default img.size), so a
+        low-res proxy and its full-quality refinement occupy the same area.
+        With reset_view=False the current zoom and pan are kept.
+        """
+        try:
+            if img is None:
+                return
+            if img.mode not in ("RGB", "RGBA", "L"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+            self.img = img
+            self.size = size or img.size
+            self.levels = [img]
+            self.generation += 1
+            self.cache.clear()
+            if reset_view:
+                self.scale = 1.0
+                self.offset = [0, 0]
+            self.render()
+        except Exception as e:
+            print(f"Error loading image: {e}")
+
+    # ---------- pyramid / tiles ---------- #
+
+    def level(self, k):
+        """Pyramid level k (1 / 2**k of full size), built on first use"""
+        while len(self.levels) <= k:
+            prev = self.levels[-1]
+            if prev.width < 2 or prev.height < 2:
+                return prev
+            self.levels.append(prev.reduce(2))
+        return self.levels[k]
+
+    def display_size(self):
+        w, h = self.size
+        return max(1, int(w * self.scale)), max(1, int(h * self.scale))
+
+    def make_tile(self, tx, ty):
+        key = (self.generation, round(self.scale, 6), tx, ty)
+        photo = self.cache.get(key)
+        if photo is not None:
+            self.cache.move_to_end(key)
+            return photo
+
+        dw, dh = self.display_size()
+        x0, y0 = tx * TILE, ty * TILE
+        x1, y1 = min(x0 + TILE, dw), min(y0 + TILE, dh)
+
+        # Scale from the full-size pixels, which may differ from the logical size
+        scale = dw / self.img.width
+        k = int(math.floor(math.log2(1 / scale))) if scale < 1.0 else 0
+        src = self.level(k)
+        f = src.width / dw
+        fy = src.height / dh
+        box = (x0 * f, y0 * fy, x1 * f, y1 * fy)
+
+        # Use LANCZOS for downscaling, BILINEAR for upscaling (faster)
+        resampling = Image.LANCZOS if f > 1.0 else Image.BILINEAR
+        tile = src.resize((x1 - x0, y1 - y0), resampling, box=box)
+
+        photo = ImageTk.PhotoImage(tile)
+        self.cache[key] = photo
+        while len(self.cache) > self.max_tiles:
+            self.cache.popitem(last=False)
+        return photo
+
+    def visible_tiles(self):
+        dw, dh = self.display_size()
+        cw, ch = max(1, self.winfo_width()), max(1, self.winfo_height())
+        vx0, vy0 = max(0, -self.offset[0]), max(0, -self.offset[1])
+        vx1, vy1 = min(dw, cw - self.offset[0]), min(dh, ch - self.offset[1])
+        if vx1 <= vx0 or vy1 <= vy0:
+            return set()
+        return {
+            (tx, ty)
+            for tx in range(vx0 // TILE, (vx1 - 1) // TILE + 1)
+            for ty in range(vy0 // TILE, (vy1 - 1) // TILE + 1)
+        }
+
+    def update_tiles(self):
+        """Create missing visible tiles and drop ones scrolled out of view"""
+        if not self.img:
+            return
+        try:
+            wanted = self.visible_tiles()
+            for key in list(self.shown):
+                if key not in wanted:
+                    self.delete(self.shown.pop(key)[0])
+            for tx, ty in wanted - set(self.shown):
+                photo = self.make_tile(tx, ty)
+                item = self.create_image(
+                    self.offset[0] + tx * TILE, self.offset[1] + ty * TILE,
+                    anchor="nw", image=photo, tags="tile"
+                )
+                self.shown[(tx, ty)] = (item, photo)
+        except Exception as e:
+            print(f"Error rendering: {e}")
+
+    def render(self):
+        """Render image with current scale and offset"""
+        self.delete("all")
+        self.shown.clear()
+        self.update_tiles()
+
+    # ---------- interaction ---------- #
+
+    def zoom(self, e):
+        try:
+            if e.delta > 0:
+                self.zoom_in()
+            else:
+                self.zoom_out()
+        except:
+            pass
+
+    def zoom_in(self):
+        self.scale = min(self.scale * 1.1, 10.0)
+        self.render()
+
+    def zoom_out(self):
+        self.scale = max(self.scale * 0.9, 0.1)
+        self.render()
+
+    def start_pan(self, e):
+        self.last = (e.x, e.y)
+        self.dragging = True
+
+    def pan(self, e):
+        if self.dragging:
+            dx = e.x - self.last[0]
+            dy = e.y - self.last[1]
+            self.offset[0] += dx
+            self.offset[1] += dy
+            self.last = (e.x, e.y)
+            self.move("tile", dx, dy)
+            self.update_tiles()
+
+    def end_pan(self, e):
+        self.dragging = False
@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import time
+import ctypes
+import ctypes.util
+import select
+import signal
+import struct
+import argparse
+import traceback
+from threading import Event
+from gk_cache import Manifest
+from gk_engine import SUPPORTED_EXT, make_job, scan_images, run_batch
+
+# ================= CONFIG ================= #
+# Watch-folder daemon: converts images as they land in a hot folder, with
+# the settings the GUI saved to config.json. New files are picked up with
+# inotify on Linux (polling elsewhere) and fed to run_batch, so one process
+# pool serves the whole session. A file is only converted once its size
+# and mtime have held still for SETTLE_SECS, so half-copied files are never
+# read, and a manifest in the output folder makes a restart skip what is
+# already done.
+#
+#   python gk_watch.py hot_folder out_folder -c config.json
+
+CONFIG_FILE = "config.json"
+SETTLE_SECS = 2.0
+POLL_SECS = 2.0
+# Longest a blocked wait goes without checking for cancel
+IDLE_SECS = 1.0
+
+# ================= INOTIFY ================= #
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT = struct.Struct("iIII")   # wd, mask, cookie, name length
+
+class Inotify:
+    """Directory change events from the Linux kernel, through libc via ctypes.
+
+    Raises OSError where inotify is unavailable. read() returns
+    (path, is_dir) pairs; (None, True) means the kernel queue overflowed
+    and events were lost.
+    """
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is Linux only")
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (AttributeError, OSError) as e:
+            raise OSError(f"inotify unavailable: {e}")
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.dirs = {}   # watch descriptor -> directory
+
+    def add(self, folder):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), folder)
+        self.dirs[wd] = folder
+
+    def add_tree(self, folder, recursive=True, exclude=()):
+        """Watch folder and (if recursive) every folder below it not in exclude"""
+        for dirpath, dirnames, _ in os.walk(folder):
+            if recursive:
+                dirnames[:] = [
+                    d for d in dirnames if os.path.abspath(os.path.join(dirpath, d)) not in exclude
+                ]
+            else:
+                dirnames[:] = []
+            try:
+                self.add(dirpath)
+            except OSError as e:
+                print(f"Cannot watch {dirpath}: {e}", file=sys.stderr)
+
+    def read(self, timeout):
+        """Events arriving within timeout seconds; sleeps in the kernel until then"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        pos = 0
+        while pos + EVENT.size <= len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, pos)
+            name = data[pos + EVENT.size:pos + EVENT.size + length].rstrip(b"\0")
+            pos += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, True))
+            elif mask & IN_IGNORED:
+                # Folder deleted or unmounted
+                self.dirs.pop(wd, None)
+            elif name and wd in self.dirs:
+                events.append((os.path.join(self.dirs[wd], os.fsdecode(name)), bool(mask & IN_ISDIR)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+# ================= POLLING ================= #
+
+class Poller:
+    """Stand-in for Inotify: diffs (size, mtime) snapshots of the tree every interval"""
+
+    def __init__(self, folder, recursive=True, exclude=(), interval=POLL_SECS):
+        self.folder = folder
+        self.recursive = recursive
+        self.exclude = exclude
+        self.interval = interval
+        self.snapshot = self.scan()
+        self.next_poll = time.monotonic() + interval
+
+    def scan(self):
+        found = {}
+        for path in scan_images(self.folder, self.recursive, self.exclude):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            found[path] = (st.st_size, st.st_mtime_ns)
+        return found
+
+    def read(self, timeout):
+        wait = self.next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0, wait))
+        self.next_poll = time.monotonic() + self.interval
+        old, self.snapshot = self.snapshot, self.scan()
+        return [(path, False) for path, sig in self.snapshot.items() if old.get(path) != sig]
+
+    def close(self):
+        pass
+
+# ================= DEBOUNCE ================= #
+
+class Settler:
+    """Files seen changing, held until they stop changing for settle seconds"""
+
+    def __init__(self, settle=SETTLE_SECS):
+        self.settle = settle
+        self.pending = {}   # path -> (deadline, (size, mtime))
+
+    def touch(self, path):
+        """(Re)start path's settle period"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.pending.pop(path, None)
+            return
+        self.pending[path] = (time.monotonic() + self.settle, (st.st_size, st.st_mtime_ns))
+
+    def ready(self):
+        """Pop (path, (size, mtime)) of files unchanged through their settle period.
+
+        One that changed without an event (e.g. a network copy that keeps
+        the file open) starts a new period instead.
+        """
+        now = time.monotonic()
+        settled = []
+        for path, (deadline, sig) in list(self.pending.items()):
+            if deadline > now:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            current = (st.st_size, st.st_mtime_ns)
+            if current == sig:
+                del self.pending[path]
+                settled.append((path, sig))
+            else:
+                self.pending[path] = (now + self.settle, current)
+        return settled
+
+    def timeout(self, longest):
+        """Seconds until the next settle deadline, at most longest"""
+        if not self.pending:
+            return longest
+        first = min(deadline for deadline, _ in self.pending.values())
+        return min(longest, max(0, first - time.monotonic()))
+
+# ================= WATCH ================= #
+
+def watch_images(folder, cancel, recursive=True, exclude=(), settle=SETTLE_SECS, poll=False):
+    """Yield images under folder as they finish landing, until cancel is set.
+
+    Images already there are yielded first, then new and rewritten ones as
+    they settle (see Settler). A file is not yielded twice with the same
+    size and mtime. Uses inotify unless poll is set or it is unavailable.
+    """
+    exclude = {os.path.abspath(p) for p in exclude}
+
+    def excluded(path):
+        path = os.path.abspath(path)
+        return any(path == ex or path.startswith(ex + os.sep) for ex in exclude)
+
+    source = None
+    if not poll:
+        try:
+            source = Inotify()
+            # Watch before listing so nothing lands unseen in between
+            source.add_tree(folder, recursive, exclude)
+        except OSError as e:
+            print(f"{e}; polling every {POLL_SECS}s instead", file=sys.stderr)
+            source = None
+    if source is None:
+        source = Poller(folder, recursive, exclude)
+
+    settler = Settler(settle)
+    for path in scan_images(folder, recursive, exclude):
+        settler.touch(path)
+
+    seen = {}
+    try:
+        while not cancel.is_set():
+            for path, is_dir in source.read(settler.timeout(IDLE_SECS)):
+                if path is None:
+                    # Events were lost: recheck everything
+                    for p in scan_images(folder, recursive, exclude):
+                        settler.touch(p)
+                elif excluded(path):
+                    continue
+                elif is_dir:
+                    if recursive:
+                        # Files can land in a new folder before it is watched
+                        source.add_tree(path, recursive, exclude)
+                        for p in scan_images(path, recursive, exclude):
+                            settler.touch(p)
+                elif os.path.splitext(path)[1].lower() in SUPPORTED_EXT:
+                    settler.touch(path)
+
+            for path, sig in settler.ready():
+                if seen.get(path) != sig:
+                    seen[path] = sig
+                    yield path
+    finally:
+        source.close()
+
+# ================= CLI ================= #
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="GK Image Tool - convert images as they land in a folder")
+    p.add_argument("input", help="folder to watch")
+    p.add_argument("output", help="output folder")
+    p.add_argument("-c", "--config", default=CONFIG_FILE,
+                   help="config.json saved by the GUI (default: %(default)s)")
+    p.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                   help="worker processes (default: all cores)")
+    p.add_argument("--settle", type=float, default=SETTLE_SECS,
+                   help="seconds a file must stay unchanged before it is converted (default: %(default)s)")
+    p.add_argument("--poll", action="store_true", help="poll the folder instead of using inotify")
+    p.add_argument("--no-recursive", dest="recursive", action="store_false", default=None,
+                   help="only watch images directly inside the input folder")
+    p.add_argument("-q", "--quiet", action="store_true")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    cfg = {}
+    try:
+        with open(args.config, "r") as f:
+            cfg = json.load(f)
+    except FileNotFoundError:
+        print(f"{args.config} not found, using default settings.")
+
+    job = make_job(cfg)
+    recursive = cfg.get("recursive", True) if args.recursive is None else args.recursive
+    memory_mb = cfg.get("memory_budget_mb")
+
+    def report(done, total, path, error):
+        if error:
+            print(f"Error processing {path}: {error}", file=sys.stderr)
+        elif not args.quiet:
+            print(f"[{done}] {os.path.relpath(path, args.input)}")
+
+    cancel = Event()
+    signal.signal(signal.SIGINT, lambda *_: cancel.set())
+    signal.signal(signal.SIGTERM, lambda *_: cancel.set())
+
+    print(f"Watching {args.input} -> {args.output} ({job['format']}). Ctrl+C to stop.")
+    try:
+        os.makedirs(args.output, exist_ok=True)
+        files = watch_images(args.input, cancel, recursive, exclude=[args.output],
+                             settle=args.settle, poll=args.poll)
+        failures, _ = run_batch(
+            files, args.output, job, args.workers,
+            on_progress=report, cancel=cancel, manifest=Manifest(args.output),
+            input_root=args.input, memory_budget=memory_mb and memory_mb * 1024 * 1024
+        )
+    except Exception:
+        traceback.print_exc()
+        return 2
+
+    print(f"Stopped. {len(failures)} failed.")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
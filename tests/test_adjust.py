@@ -0,0 +1,37 @@
+import os
+import sys
+import itertools
+import unittest
+from PIL import ImageChops, ImageEnhance
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gk_bench import synthetic_image
+from gk_engine import apply_tone
+
+BRIGHTNESS = (0.6, 0.9, 1.0, 1.1, 1.3, 1.5)
+CONTRAST = (0.5, 1.0, 1.5, 1.97, 2.0)
+SATURATION = (0.0, 1.0, 1.2, 1.54, 2.0)
+# (size, mode, seed) of gk_bench synthetic photos
+IMAGES = [((640, 480), "RGB", 0), ((640, 480), "RGB", 1), ((320, 240), "RGBA", 2), ((97, 61), "RGB", 3)]
+
+def enhance_chain(img, brightness, contrast, saturation):
+    """What apply_tone stands in for"""
+    img = ImageEnhance.Brightness(img).enhance(brightness)
+    img = ImageEnhance.Contrast(img).enhance(contrast)
+    return ImageEnhance.Color(img).enhance(saturation)
+
+def max_difference(a, b):
+    return max(hi for _, hi in ImageChops.difference(a, b).getextrema())
+
+class ApplyToneTest(unittest.TestCase):
+    def test_matches_imageenhance_chain(self):
+        for size, mode, seed in IMAGES:
+            img = synthetic_image(size, mode, seed)
+            for b, c, s in itertools.product(BRIGHTNESS, CONTRAST, SATURATION):
+                with self.subTest(size=img.size, mode=img.mode, b=b, c=c, s=s):
+                    diff = max_difference(apply_tone(img, b, c, s), enhance_chain(img, b, c, s))
+                    self.assertLessEqual(diff, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import tempfile
+import unittest
+from threading import Thread
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gk_engine import PRESETS, make_job, output_paths, run_batch, scan_images
+
+# A hung pool fails the test instead of the CI job
+TIMEOUT_SECS = 120
+
+def make_folder(root):
+    """Small mixed-format tree, so workers load several Pillow plugins"""
+    os.makedirs(os.path.join(root, "sub"))
+    files = []
+    for i, ext in enumerate((".png", ".jpg", ".webp", ".bmp", ".tiff")):
+        for folder in (root, os.path.join(root, "sub")):
+            path = os.path.join(folder, f"img{i}{ext}")
+            Image.new("RGB", (640, 480), (40 * i, 80, 160)).save(path)
+            files.append(path)
+    return files
+
+def run_with_timeout(*args, **kwargs):
+    result = {}
+
+    def target():
+        result["value"] = run_batch(*args, **kwargs)
+
+    thread = Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(TIMEOUT_SECS)
+    if thread.is_alive():
+        raise AssertionError(f"run_batch did not finish within {TIMEOUT_SECS}s")
+    return result["value"]
+
+class RunBatchTest(unittest.TestCase):
+    def test_converts_generated_folder(self):
+        job = make_job(format="JPG", width=320, height=200)
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "in")
+            files = make_folder(src)
+            # Several runs: a fork-time deadlock only shows up some of the time
+            for run in range(3):
+                out = os.path.join(tmp, f"out{run}")
+                failures, cancelled = run_with_timeout(
+                    scan_images(src), out, job, workers=2, input_root=src
+                )
+                self.assertEqual(failures, [])
+                self.assertFalse(cancelled)
+                for path in files:
+                    rel = os.path.relpath(os.path.dirname(path), src)
+                    name = "gk_" + os.path.splitext(os.path.basename(path))[0] + ".jpeg"
+                    with Image.open(os.path.join(out, rel, name)) as img:
+                        self.assertEqual(img.size, (320, 240))
+
+    def test_fanout_outputs_match_their_names(self):
+        job = make_job(format="PNG", presets=list(PRESETS))
+        with tempfile.TemporaryDirectory() as tmp:
+            src = os.path.join(tmp, "in")
+            os.makedirs(src)
+            # 3:2, so every preset needs a different crop
+            path = os.path.join(src, "wide.jpg")
+            Image.new("RGB", (1800, 1200), (200, 120, 40)).save(path)
+            out = os.path.join(tmp, "out")
+            failures, _ = run_with_timeout([path], out, job, workers=1, input_root=src)
+            self.assertEqual(failures, [])
+
+            outputs = output_paths(path, out, job)
+            self.assertEqual(len(outputs), len(set(PRESETS.values())))
+            for out_path, size in zip(outputs, PRESETS.values()):
+                self.assertTrue(out_path.endswith(f"_{size[0]}x{size[1]}.png"))
+                with Image.open(out_path) as img:
+                    self.assertEqual(img.size, size)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gk_bench import BENCH_JOB, _descendant_pids, bench_batch, corpus_spec, make_corpus
+from gk_engine import make_job, pool_context
+
+@unittest.skipUnless(os.path.isdir("/proc"), "RSS is read from /proc")
+class BatchRSSTest(unittest.TestCase):
+    def test_counts_forkserver_workers(self):
+        with ProcessPoolExecutor(max_workers=1, mp_context=pool_context()) as pool:
+            worker = pool.submit(os.getpid).result()
+            self.assertIn(str(worker), _descendant_pids())
+
+    def test_peak_grows_with_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            spec = corpus_spec(["medium"], ["RGB"], [".png", ".bmp", ".tiff", ".webp"])
+            paths = make_corpus(tmp, spec)
+            results = bench_batch(paths, make_job(BENCH_JOB), [1, 4])
+        self.assertGreater(results["4"]["peak_rss_mb"], results["1"]["peak_rss_mb"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gk_cache import Manifest, ResultCache
+from gk_engine import make_job, write_image
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def shift_mtime(path, secs=10):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + secs * 10**9))
+    return os.stat(path).st_mtime_ns
+
+class ManifestTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = self.tmp.name
+        self.src = os.path.join(root, "a.png")
+        self.out = os.path.join(root, "gk_a.jpeg")
+        write(self.src, b"source bytes")
+        write(self.out, b"output")
+        self.job = make_job(format="JPG")
+        self.manifest = Manifest(root)
+        self.manifest.record(self.src, [self.out], self.job)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def is_current(self, job=None):
+        return self.manifest.is_current(self.src, [self.out], job or self.job)
+
+    def test_unchanged_is_skipped(self):
+        self.assertTrue(self.is_current())
+
+    def test_survives_save_and_reload(self):
+        self.manifest.save()
+        self.manifest = Manifest(self.tmp.name)
+        self.assertTrue(self.is_current())
+
+    def test_touched_with_same_bytes_is_skipped(self):
+        mtime = shift_mtime(self.src)
+        self.assertTrue(self.is_current())
+        # The new mtime is kept, so the next check does not hash again
+        self.assertEqual(self.manifest.entries[os.path.abspath(self.src)]["mtime"], mtime)
+
+    def test_changed_size_is_redone(self):
+        write(self.src, b"longer source bytes")
+        self.assertFalse(self.is_current())
+
+    def test_changed_bytes_are_redone(self):
+        write(self.src, b"SOURCE BYTES")
+        shift_mtime(self.src)
+        self.assertFalse(self.is_current())
+
+    def test_changed_job_is_redone(self):
+        self.assertFalse(self.is_current(make_job(format="WEBP")))
+        self.assertFalse(self.is_current(make_job(format="JPG", brightness=1.2)))
+
+    def test_deleted_output_is_redone(self):
+        os.remove(self.out)
+        self.assertFalse(self.is_current())
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = self.tmp.name
+        self.out = os.path.join(root, "out")
+        os.makedirs(self.out)
+        self.outputs = [os.path.join(self.out, "a_1x1.webp"), os.path.join(self.out, "a_2x2.webp")]
+        for i, path in enumerate(self.outputs):
+            write(path, b"result %d" % i)
+        self.cache = ResultCache(os.path.join(root, "cache"))
+        self.key = self.cache.key("source digest", make_job(format="WEBP"))
+        self.cache.store(self.key, self.outputs)
+        for path in self.outputs:
+            os.remove(path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_fetched(self):
+        for i, path in enumerate(self.outputs):
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), b"result %d" % i)
+        self.assertEqual(sorted(os.listdir(self.out)), sorted(os.path.basename(p) for p in self.outputs))
+
+    def test_hit(self):
+        self.assertTrue(self.cache.fetch(self.key, self.outputs))
+        self.assert_fetched()
+
+    def test_miss(self):
+        other = self.cache.key("source digest", make_job(format="JPG"))
+        self.assertNotEqual(other, self.key)
+        self.assertFalse(self.cache.fetch(other, self.outputs))
+        self.assertEqual(os.listdir(self.out), [])
+
+    def test_link(self):
+        self.cache.link = True
+        self.assertTrue(self.cache.fetch(self.key, self.outputs))
+        self.assert_fetched()
+        self.assertTrue(os.path.samefile(self.outputs[0], self.cache.path(self.key, 0)))
+
+    def test_link_falls_back_to_copy(self):
+        self.cache.link = True
+        with mock.patch("gk_cache.os.link", side_effect=OSError("cross-device link")):
+            self.assertTrue(self.cache.fetch(self.key, self.outputs))
+        self.assert_fetched()
+        self.assertFalse(os.path.samefile(self.outputs[0], self.cache.path(self.key, 0)))
+
+    def test_fetch_leaves_other_writers_temp_alone(self):
+        other = f"{self.outputs[0]}.tmp"
+        write(other, b"another worker")
+        self.assertTrue(self.cache.fetch(self.key, self.outputs))
+        with open(other, "rb") as f:
+            self.assertEqual(f.read(), b"another worker")
+
+class WriteImageTest(unittest.TestCase):
+    def test_leaves_other_writers_temp_alone(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.webp")
+            other = f"{path}.tmp"
+            write(other, b"another worker")
+            write_image(Image.new("RGB", (8, 8)), path, "WEBP")
+            with Image.open(path) as img:
+                self.assertEqual(img.size, (8, 8))
+            with open(other, "rb") as f:
+                self.assertEqual(f.read(), b"another worker")
+            self.assertEqual(sorted(os.listdir(tmp)), ["a.webp", "a.webp.tmp"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import io
+import os
+import sys
+import unittest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gk_bench import synthetic_image
+from gk_engine import DEFAULT_QUALITY, ENCODER_PROFILES, MIN_QUALITY, encode_image, encode_to_size, save_image
+
+def encoded(img, fmt, **options):
+    buf = io.BytesIO()
+    save_image(img, buf, fmt, **options)
+    return buf.getvalue()
+
+class EncodeToSizeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.img = synthetic_image((640, 480), "RGB", 0)
+
+    def test_fits_when_reachable(self):
+        for fmt in ("JPG", "WEBP"):
+            with self.subTest(fmt=fmt):
+                full = len(encoded(self.img, fmt))
+                smallest = len(encoded(self.img, fmt, quality=MIN_QUALITY))
+                max_bytes = (full + smallest) // 2
+                data, quality = encode_to_size(self.img, fmt, max_bytes)
+                self.assertLessEqual(len(data), max_bytes)
+                start = ENCODER_PROFILES["balanced"][fmt].get("quality", DEFAULT_QUALITY[fmt])
+                self.assertLess(quality, start)
+                self.assertGreaterEqual(quality, MIN_QUALITY)
+                self.assertEqual(data, encoded(self.img, fmt, quality=quality))
+                with Image.open(io.BytesIO(data)) as img:
+                    self.assertEqual(img.size, self.img.size)
+
+    def test_profile_quality_kept_when_it_fits(self):
+        data, quality = encode_to_size(self.img, "JPG", 10 * 1024 * 1024, "smallest")
+        self.assertEqual(quality, ENCODER_PROFILES["smallest"]["JPG"]["quality"])
+        self.assertEqual(data, encoded(self.img, "JPG", profile="smallest"))
+
+    def test_smallest_quality_when_unreachable(self):
+        for fmt in ("JPG", "WEBP"):
+            with self.subTest(fmt=fmt):
+                data, quality = encode_to_size(self.img, fmt, 1)
+                self.assertEqual(quality, MIN_QUALITY)
+                self.assertEqual(data, encoded(self.img, fmt, quality=MIN_QUALITY))
+
+    def test_formats_without_quality_pass_through(self):
+        data, quality = encode_image(self.img, "PNG", max_kb=1)
+        self.assertIsNone(quality)
+        self.assertEqual(data, encoded(self.img, "PNG"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import sys
+import json
+import unittest
+from threading import Thread
+from http.client import HTTPConnection
+from concurrent.futures.process import BrokenProcessPool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gk_server import Coalescer, ConvertHandler, ThreadingHTTPServer, start_pool
+
+class CoalescerTest(unittest.TestCase):
+    def test_replaces_broken_pool(self):
+        coalescer = Coalescer(start_pool(1), lambda: start_pool(1))
+        try:
+            fut, _ = coalescer.submit("crash", os._exit, 1)
+            with self.assertRaises(BrokenProcessPool):
+                fut.result()
+            fut, _ = coalescer.submit("after", abs, -3)
+            self.assertEqual(fut.result(), 3)
+        finally:
+            coalescer.pool.shutdown()
+
+class RequestTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        pool = start_pool(1)
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ConvertHandler)
+        cls.server.daemon_threads = True
+        cls.server.workers = 1
+        cls.server.coalescer = Coalescer(pool, lambda: start_pool(1))
+        cls.server.root = os.path.realpath(os.path.dirname(__file__))
+        cls.server.quiet = True
+        Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.server.coalescer.pool.shutdown()
+
+    def post_json(self, body):
+        conn = HTTPConnection("127.0.0.1", self.server.server_port)
+        try:
+            conn.request("POST", "/convert", json.dumps(body), {"Content-Type": "application/json"})
+            reply = conn.getresponse()
+            return reply.status, json.loads(reply.read())
+        finally:
+            conn.close()
+
+    def test_job_must_be_an_object(self):
+        for job in (["JPG"], "JPG", 3):
+            with self.subTest(job=job):
+                status, reply = self.post_json({"path": __file__, "job": job})
+                self.assertEqual(status, 400)
+                self.assertIn("job", reply["error"])
+
+    def test_bad_job_value(self):
+        status, _ = self.post_json({"path": __file__, "job": {"encoder": ["fast"]}})
+        self.assertEqual(status, 400)
+
+if __name__ == "__main__":
+    unittest.main()